@@ -0,0 +1,152 @@
+"""
+Benchmark each stage of the fear_data pipeline on synthetic VideoFreeze exports.
+
+Usage:
+    python benchmarks/bench_pipeline.py --animals 8 32 128 --bin-sizes 20 1 --out results.json
+    python benchmarks/bench_pipeline.py --animals 8 --bin-sizes 20 --stages plot_fc_bins plot_fc_phase
+    python benchmarks/bench_pipeline.py --compare old.json new.json
+
+For every combination of animal count and bin size a synthetic experiment is generated
+with `fear_data.fc_synth`, then each stage is timed (best of `--repeat` runs) and run
+once more under tracemalloc to record peak memory. Results are written as JSON, tagged
+with the current git commit, so runs from different commits can be compared.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+from os.path import dirname, abspath, join
+
+REPO_DIR = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import pandas as pd
+from fear_data import fc_dat, fc_synth
+
+
+###################################################################################################
+###################################################################################################
+
+def _plot(plot_name):
+    """Return a stage that draws `plot_name` with the Agg backend and closes the figure."""
+    def stage(config_path, session, cleaned):
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        from fear_data import fc_viz
+        if plot_name == 'plot_fc_bins':
+            fc_viz.plot_fc_bins(cleaned, session)
+        else:
+            fc_viz.plot_fc_phase(cleaned)
+        plt.close('all')
+    return stage
+
+
+# stage name -> (sessions it runs on, function(config_path, session, cleaned_df))
+STAGES = {'load_data': (['train', 'tone', 'context'], lambda cfg, ses, df: fc_dat.load_data(cfg, ses)),
+          'clean_data': (['train', 'tone', 'context'], lambda cfg, ses, df: fc_dat.clean_data(cfg, ses)),
+          'label_fc_data': (['train', 'tone'], lambda cfg, ses, df: fc_dat.label_fc_data(cfg, ses)),
+          'tfc_trials_df': (['train', 'tone'], lambda cfg, ses, df: fc_dat.tfc_trials_df(cfg, ses)),
+          'total_df': (['train', 'tone'], lambda cfg, ses, df: fc_dat.total_df(df)),
+          'plot_fc_bins': (['train', 'tone'], _plot('plot_fc_bins')),
+          'plot_fc_phase': (['train', 'tone'], _plot('plot_fc_phase'))}
+PLOT_STAGES = ['plot_fc_bins', 'plot_fc_phase']
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_stage(func, config_path, session, cleaned, repeat=3):
+    """Return (best wall time in sec, peak traced memory in MB) of `func`."""
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func(config_path, session, cleaned)
+        times.append(time.perf_counter() - t0)
+    tracemalloc.start()
+    func(config_path, session, cleaned)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return min(times), peak / 1e6
+
+
+def run_benchmarks(n_animals_list, bin_sizes, stages, repeat=3, n_trials=None, quoted=True):
+    """Run `stages` over every (n_animals, bin_size) combination and return a list of results."""
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n_animals in n_animals_list:
+            for bin_size in bin_sizes:
+                out_dir = join(tmp_dir, f'{n_animals}_{bin_size}')
+                config_path = fc_synth.make_vf_experiment(out_dir, n_animals=n_animals, bin_size=bin_size,
+                                                          n_trials=n_trials, quoted=quoted)
+                cleaned = {}
+                for stage in stages:
+                    sessions, func = STAGES[stage]
+                    for session in sessions:
+                        if session not in cleaned:
+                            cleaned[session] = fc_dat.clean_data(config_path, session)
+                        wall, peak = run_stage(func, config_path, session, cleaned[session], repeat)
+                        results.append({'stage': stage, 'session': session, 'n_animals': n_animals,
+                                        'bin_size': bin_size, 'rows': len(cleaned[session]),
+                                        'wall_s': wall, 'peak_mb': peak})
+                        print(f'{stage:>14} {session:>8} animals={n_animals:<5} bin={bin_size:<5} '
+                              f'rows={len(cleaned[session]):<9} {wall:8.4f}s {peak:9.1f}MB')
+
+    return results
+
+
+def compare(old_file, new_file):
+    """Print the ratio of new/old wall time and peak memory for each benchmark."""
+    keys = ['stage', 'session', 'n_animals', 'bin_size']
+    old, new = [pd.DataFrame(json.load(open(file))['results']).set_index(keys) for file in [old_file, new_file]]
+    df = old.join(new, lsuffix='_old', rsuffix='_new', how='inner')
+    df['wall_ratio'] = df['wall_s_new'] / df['wall_s_old']
+    df['mem_ratio'] = df['peak_mb_new'] / df['peak_mb_old']
+    print(df[['wall_s_old', 'wall_s_new', 'wall_ratio', 'peak_mb_old', 'peak_mb_new', 'mem_ratio']]
+          .round(3).to_string())
+
+    return df
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--animals', type=int, nargs='+', default=[8, 32])
+    parser.add_argument('--bin-sizes', type=float, nargs='+', default=[20, 1])
+    parser.add_argument('--trials', type=int, default=None, help='number of trials (default: protocol)')
+    parser.add_argument('--stages', nargs='+', default=[stage for stage in STAGES if stage not in PLOT_STAGES],
+                        choices=list(STAGES), help='stages to run (default: all except plots)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--unquoted', action='store_true', help='write data tables without quotes')
+    parser.add_argument('--out', default=None, help='JSON file to write results to')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two result files')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    results = run_benchmarks(args.animals, args.bin_sizes, args.stages, args.repeat,
+                             args.trials, not args.unquoted)
+    if args.out:
+        meta = {'commit': git_commit(), 'python': platform.python_version(),
+                'pandas': pd.__version__, 'platform': platform.platform()}
+        os.makedirs(dirname(abspath(args.out)), exist_ok=True)
+        with open(args.out, 'w') as f:
+            json.dump({'meta': meta, 'results': results}, f, indent=1)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,63 @@
+"""
+Check that importing the data functions stays fast and does not pull in plotting libraries.
+
+Usage: python benchmarks/check_import_time.py [--budget 0.25] [--repeat 5]
+
+The import time of `fear_data` is compared to importing its data dependencies
+(pandas, numpy, yaml) alone. Exits with status 1 if the difference is over budget
+or if matplotlib/seaborn are imported.
+"""
+import sys
+import json
+import argparse
+import subprocess
+from os.path import dirname, abspath
+
+REPO_DIR = dirname(dirname(abspath(__file__)))
+PLOT_MODULES = ['matplotlib', 'seaborn']
+
+
+###################################################################################################
+###################################################################################################
+
+def time_import(stmt, repeat=5):
+    """Best of `repeat` wall times (sec) to run `stmt` in a fresh interpreter, and the modules it loaded."""
+    code = ('import sys, time; t0 = time.perf_counter(); ' + stmt + '; '
+            'dt = time.perf_counter() - t0; import json; '
+            'print(json.dumps([dt, sorted(sys.modules)]))')
+    times = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', code], cwd=REPO_DIR,
+                             capture_output=True, text=True, check=True).stdout
+        dt, modules = json.loads(out)
+        times.append(dt)
+
+    return min(times), modules
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--budget', type=float, default=0.25,
+                        help='allowed import time (sec) on top of pandas/numpy/yaml')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    base_time, _ = time_import('import pandas, numpy, yaml', args.repeat)
+    pkg_time, modules = time_import('import fear_data', args.repeat)
+    plot_mods = [mod for mod in PLOT_MODULES if mod in modules]
+    overhead = pkg_time - base_time
+    print(f'pandas/numpy/yaml: {base_time:.3f}s  fear_data: {pkg_time:.3f}s  '
+          f'overhead: {overhead:.3f}s (budget {args.budget:.3f}s)')
+    failed = False
+    if overhead > args.budget:
+        print('FAIL: import time over budget')
+        failed = True
+    if plot_mods:
+        print(f'FAIL: importing fear_data loaded {plot_mods}')
+        failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
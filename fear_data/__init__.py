@@ -0,0 +1,39 @@
+"""
+Tools to analyze data from VideoFreeze data files.
+
+Data loading functions only require pandas, numpy and yaml. The plotting modules
+(`fc_viz`, `plot_utils`) import matplotlib and seaborn, so they are loaded on first use.
+"""
+import importlib
+from . import fc_dat
+from .fc_dat import load_expt_config, load_data, clean_data, total_df, label_fc_data, tfc_trials_df
+
+# name -> module, imported on first access
+_LAZY_MODULES = {'fc_viz': '.fc_viz',
+                 'plot_utils': '.plot_utils',
+                 'fc_batch': '.fc_batch',
+                 'fc_cache': '.fc_cache',
+                 'fc_render': '.fc_render',
+                 'fc_stream': '.fc_stream',
+                 'fc_score': '.fc_score',
+                 'fc_motion': '.fc_motion',
+                 'fc_db': '.fc_db',
+                 'fc_watch': '.fc_watch',
+                 'fc_export': '.fc_export'}
+_LAZY_ATTRS = {'plot_fc_bins': '.fc_viz',
+               'plot_fc_phase': '.fc_viz',
+               'load_experiments': '.fc_batch',
+               'load_experiment': '.fc_batch',
+               'render_figures': '.fc_render'}
+
+
+def __getattr__(name):
+    if name in _LAZY_MODULES:
+        return importlib.import_module(_LAZY_MODULES[name], __name__)
+    if name in _LAZY_ATTRS:
+        return getattr(importlib.import_module(_LAZY_ATTRS[name], __name__), name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_MODULES) + list(_LAZY_ATTRS))
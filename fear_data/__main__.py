@@ -0,0 +1,5 @@
+"""Run the command line interface: python -m fear_data --help"""
+import sys
+from .cli import main
+
+sys.exit(main())
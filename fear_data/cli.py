@@ -0,0 +1,276 @@
+"""
+Command line batch processing.
+
+Usage:
+    python -m fear_data process expt_config.yaml [more configs] --sessions train tone context --jobs 8 --out results/
+
+For each config/session the cleaned data, Prism table, labeled data, trial data (not for
+'context' sessions) and figures are written to `--out` as '<Experiment>_<session>_<task>' files
+(configs sharing an `Experiment` name get a hash of their path appended). Sessions run in parallel worker
+processes. A manifest in the output directory records the inputs each output was made
+from, and outputs whose raw file, config and options are unchanged are skipped (use
+`--force` to rebuild). A JSON summary of timings and failures is printed on exit, and the
+exit status is 1 if any task failed.
+"""
+import os
+import sys
+import json
+import hashlib
+import time
+import argparse
+from contextlib import redirect_stdout
+from os.path import join, exists, abspath, getsize, getmtime
+from concurrent.futures import ProcessPoolExecutor
+from .fc_dat import (load_expt_config, session_file, load_data, label_phases, clean_columns, prism_table,
+                     _label_session, window_trials)
+from .fc_cache import file_hash, config_hash
+from .fc_batch import cohort_name
+
+MANIFEST = 'fear_data_manifest.json'
+
+
+###################################################################################################
+###################################################################################################
+
+def session_tasks(session, figures=True):
+    """Tasks run for `session` ('label' and 'trials' need tone trials, so not for context)."""
+    tasks = ['clean', 'prism']
+    if session.lower() != 'context':
+        tasks += ['label', 'trials']
+    return tasks + (['figures'] if figures else [])
+
+
+def task_outputs(out_dir, name, session, task, fmts):
+    """Paths written by `task`."""
+    if task != 'figures':
+        return [join(out_dir, f'{name}_{session}_{task}.csv')]
+    plots = ['bins'] if session.lower() == 'context' else ['bins', 'phase']
+    return [join(out_dir, f'{name}_{session}_{plot}.{fmt}') for plot in plots for fmt in fmts]
+
+
+def output_name(cohort, config_path, names):
+    """
+    Prefix of the output files of a config: its cohort name, or the cohort name with a
+    hash of the config path if another config already writes under that name.
+    `names` (name -> config path, kept in the manifest) is updated with the name used.
+    """
+    config_path = abspath(config_path)
+    path_hash = hashlib.blake2b(config_path.encode(), digest_size=4).hexdigest()
+    for name in [cohort, f'{cohort}_{path_hash}']:
+        if names.setdefault(name, config_path) == config_path:
+            return name
+    raise ValueError(f'output name {name!r} of {config_path} is already used by {names[name]}')
+
+
+def _file_state(file, prev=None):
+    """Size, mtime and hash of `file`, reusing the hash in `prev` if size and mtime are unchanged."""
+    size, mtime = getsize(file), getmtime(file)
+    if prev and prev.get('size') == size and prev.get('mtime') == mtime:
+        return prev
+    return {'size': size, 'mtime': mtime, 'hash': file_hash(file)}
+
+
+def _is_current(entry, inputs, options):
+    """True if a manifest entry was made from the same inputs/options and its outputs exist."""
+    if entry is None or entry.get('options') != options:
+        return False
+    if any(entry['inputs'].get(file, {}).get('hash') != state['hash'] for file, state in inputs.items()):
+        return False
+    return all(exists(path) for path in entry['outputs'])
+
+
+class _Session:
+    """Raw export of one session, parsed once and shared by every task of a job."""
+
+    def __init__(self, config_path, session):
+        self.config_path, self.session = config_path, session
+        self._cache = {}
+
+    def _get(self, key, func):
+        if key not in self._cache:
+            self._cache[key] = func()
+        return self._cache[key]
+
+    @property
+    def raw(self):
+        return self._get('raw', lambda: load_data(self.config_path, self.session, return_header=True))
+
+    @property
+    def clean(self):
+        """Output of `clean_data` with every column kept (used for prism tables and figures)."""
+        phase_rules = load_expt_config(self.config_path).get('phase_rules')
+        return self._get('clean', lambda: label_phases(self.raw[0].copy(), self.session, phase_rules))
+
+    @property
+    def labeled(self):
+        """(df, comp_labs) from `label_fc_data`."""
+        return self._get('labeled', lambda: _label_session(self.config_path, self.session, data=self.raw))
+
+
+def _run_task(data, task, out_dir, name, fmts):
+    """Run one task on the loaded session and write its outputs."""
+    config_path, session = data.config_path, data.session
+    paths = task_outputs(out_dir, name, session, task, fmts)
+    if task == 'clean':
+        data.clean.reindex(columns=clean_columns(load_expt_config(config_path))).to_csv(paths[0], index=False)
+    elif task == 'prism':
+        prism_table(data.clean).to_csv(paths[0], index=False)
+    elif task == 'label':
+        data.labeled[0].to_csv(paths[0], index=False)
+    elif task == 'trials':
+        df, comp_labs = data.labeled
+        window_trials(df.copy(), comp_labs).to_csv(paths[0], index=False)
+    elif task == 'figures':
+        from .fc_render import render_figures
+        plots = ['bins'] if session.lower() == 'context' else ['bins', 'phase']
+        specs = [{'plot': plot, 'config_path': config_path, 'session': session, 'data': data.clean,
+                  'name': f'{name}_{session}_{plot}'} for plot in plots]
+        results = render_figures(specs, out_dir, fmt=fmts, n_jobs=1)
+        errors = results['error'].dropna()
+        if len(errors):
+            raise RuntimeError(errors.iloc[0])
+    return paths
+
+
+def _run_job(config_path, session, tasks, out_dir, name, fmts):
+    """Worker: run the tasks of one config/session in order, parsing the raw export once."""
+    data = _Session(config_path, session)
+    results = []
+    for task in tasks:
+        t0 = time.perf_counter()
+        try:
+            # keep stdout for the JSON summary
+            with redirect_stdout(sys.stderr):
+                paths = _run_task(data, task, out_dir, name, fmts)
+            results.append({'task': task, 'status': 'ok', 'outputs': paths, 'error': None})
+        except Exception as err:
+            results.append({'task': task, 'status': 'failed', 'outputs': [], 'error': repr(err)})
+        results[-1]['wall_s'] = round(time.perf_counter() - t0, 4)
+
+    return results
+
+
+###################################################################################################
+
+def process(config_paths, out_dir, sessions=None, n_jobs=None, figures=True, fmt='png', force=False):
+    """
+    Process sessions from many configs into `out_dir`, skipping up to date outputs.
+
+    Parameters
+    ----------
+    config_paths : list of paths to project yaml files.
+    out_dir : directory to write outputs and the manifest to.
+    sessions : sessions to process (default: all sessions in each config).
+    n_jobs : number of worker processes (default: os.cpu_count()). Use 1 to run in-process.
+    figures : if True, also render `plot_fc_bins`/`plot_fc_phase` figures.
+    fmt : figure format or list of formats.
+    force : if True, rebuild every output.
+
+    Returns
+    -------
+    summary : dict with the total 'wall_s', counts of 'ok'/'skipped'/'failed' tasks and a
+        record of each task.
+    """
+    t0 = time.perf_counter()
+    fmts = [fmt] if isinstance(fmt, str) else list(fmt)
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_file = join(out_dir, MANIFEST)
+    manifest = {}
+    if exists(manifest_file):
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+    records, jobs = [], []
+    for config_path in config_paths:
+        try:
+            with redirect_stdout(sys.stderr):
+                expt_info = load_expt_config(config_path)
+            name = output_name(cohort_name(config_path), config_path, manifest.setdefault('names', {}))
+            cfg_sessions = sessions if sessions is not None else expt_info['sessions']
+        except Exception as err:
+            records.append({'config_path': config_path, 'session': None, 'task': None,
+                            'status': 'failed', 'outputs': [], 'error': repr(err), 'wall_s': 0})
+            continue
+        for session in cfg_sessions:
+            key_base = f'{abspath(config_path)}|{session}'
+            try:
+                files = [session_file(expt_info, session)]
+                if expt_info.get('comp_labs_file'):
+                    files.append(expt_info['comp_labs_file'])
+                inputs = {abspath(file): _file_state(file, manifest.get(key_base, {}).get(abspath(file)))
+                          for file in files}
+            except Exception as err:
+                records.append({'config_path': config_path, 'session': session, 'task': None,
+                                'status': 'failed', 'outputs': [], 'error': repr(err), 'wall_s': 0})
+                continue
+            manifest[key_base] = inputs
+            options = {'config': config_hash(expt_info, keys=sorted(expt_info)), 'fmt': fmts}
+            todo = []
+            for task in session_tasks(session, figures):
+                entry = manifest.get(f'{key_base}|{task}')
+                if not force and _is_current(entry, inputs, options):
+                    records.append({'config_path': config_path, 'session': session, 'task': task,
+                                    'status': 'skipped', 'outputs': entry['outputs'], 'error': None,
+                                    'wall_s': 0})
+                else:
+                    todo.append(task)
+            if todo:
+                jobs.append(((config_path, session, todo, out_dir, name, fmts), key_base, inputs, options))
+
+    def record(job, results):
+        config_path, session = job[0][:2]
+        for res in results:
+            records.append({'config_path': config_path, 'session': session, **res})
+            if res['status'] == 'ok':
+                manifest[f"{job[1]}|{res['task']}"] = {'inputs': job[2], 'options': job[3],
+                                                       'outputs': res['outputs']}
+
+    if n_jobs == 1:
+        for job in jobs:
+            record(job, _run_job(*job[0]))
+    elif jobs:
+        with ProcessPoolExecutor(max_workers=n_jobs or os.cpu_count()) as pool:
+            futures = [(job, pool.submit(_run_job, *job[0])) for job in jobs]
+            for job, future in futures:
+                record(job, future.result())
+    tmp_file = manifest_file + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_file, manifest_file)
+    statuses = [rec['status'] for rec in records]
+
+    return {'wall_s': round(time.perf_counter() - t0, 4),
+            'ok': statuses.count('ok'),
+            'skipped': statuses.count('skipped'),
+            'failed': statuses.count('failed'),
+            'tasks': records}
+
+
+###################################################################################################
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='fear_data', description='Batch processing of VideoFreeze data.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    proc = commands.add_parser('process', help='load, clean, label and plot sessions from config files')
+    proc.add_argument('configs', nargs='+', help='expt_config.yaml files')
+    proc.add_argument('--sessions', nargs='+', default=None, help='sessions to process (default: all in each config)')
+    proc.add_argument('--jobs', type=int, default=None, help='number of worker processes (default: all CPUs)')
+    proc.add_argument('--out', required=True, help='output directory')
+    proc.add_argument('--fmt', nargs='+', default=['png'], help='figure formats (e.g. png svg pdf)')
+    proc.add_argument('--no-figures', action='store_true', help='skip figure rendering')
+    proc.add_argument('--force', action='store_true', help='rebuild outputs even if they are up to date')
+    proc.add_argument('--summary', default=None, help='also write the JSON summary to this file')
+    args = parser.parse_args(argv)
+
+    summary = process(args.configs, args.out, sessions=args.sessions, n_jobs=args.jobs,
+                      figures=not args.no_figures, fmt=args.fmt, force=args.force)
+    out = json.dumps(summary, indent=1)
+    if args.summary:
+        with open(args.summary, 'w') as f:
+            f.write(out)
+    print(out)
+
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""
+Functions for loading data from many experiments (cohorts) at once.
+"""
+import os
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import pandas as pd
+from .fc_dat import load_expt_config, clean_data, concat_compact, animal_metadata
+
+
+###################################################################################################
+###################################################################################################
+
+def cohort_name(config_path):
+    """Name of the cohort in `config_path` ('Experiment' entry, or the config file name)."""
+    expt_info = load_expt_config(config_path)
+    return expt_info.get('Experiment') or Path(config_path).stem
+
+
+def _load_session(config_path, session, kwargs):
+    """Worker for `iter_experiments`."""
+    return clean_data(config_path, session, **kwargs)
+
+
+def _batch_jobs(config_paths, sessions):
+    """List (config_path, session) jobs, and (config_path, None, error) for unreadable configs."""
+    jobs, failed = [], []
+    for config_path in config_paths:
+        try:
+            cfg_sessions = sessions if sessions is not None else load_expt_config(config_path)['sessions']
+        except Exception as err:
+            failed.append((config_path, None, err))
+            continue
+        jobs += [(config_path, session) for session in cfg_sessions]
+
+    return jobs, failed
+
+
+###################################################################################################
+
+def iter_experiments(config_paths, sessions=None, n_jobs=None, ordered=True, **kwargs):
+    """
+    Load sessions from many config files in a process pool.
+
+    Parameters
+    ----------
+    config_paths : list of paths to project yaml files.
+    sessions : list of sessions to load from each config (default: all sessions in the config).
+    n_jobs : number of worker processes (default: os.cpu_count()). Use 1 to load serially.
+    ordered : if True results are returned in input order, otherwise as they complete.
+    **kwargs : passed to `clean_data`.
+
+    Yields
+    ------
+    config_path, session, result : result is the cleaned DataFrame, or the exception
+        raised while loading it.
+    """
+    jobs, failed = _batch_jobs(config_paths, sessions)
+    yield from failed
+    if n_jobs == 1:
+        for config_path, session in jobs:
+            try:
+                yield config_path, session, _load_session(config_path, session, kwargs)
+            except Exception as err:
+                yield config_path, session, err
+        return
+
+    with ProcessPoolExecutor(max_workers=n_jobs or os.cpu_count()) as pool:
+        futures = {pool.submit(_load_session, config_path, session, kwargs): (config_path, session)
+                   for config_path, session in jobs}
+        for future in (futures if ordered else as_completed(futures)):
+            config_path, session = futures[future]
+            err = future.exception()
+            yield config_path, session, err if err is not None else future.result()
+
+
+def load_experiments(config_paths, sessions=None, n_jobs=None, ordered=True, **kwargs):
+    """
+    Load and concatenate sessions from many config files in parallel.
+
+    Parameters
+    ----------
+    config_paths : list of paths to project yaml files.
+    sessions : list of sessions to load from each config (default: all sessions in the config).
+    n_jobs : number of worker processes (default: os.cpu_count()). Use 1 to load serially.
+    ordered : if True rows are concatenated in input order, otherwise in order of completion.
+    **kwargs : passed to `clean_data`. With `compact=True`, categorical columns stay
+        categorical across sessions (see `fc_dat.concat_compact`).
+
+    Returns
+    -------
+    df : pandas DataFrame of all loaded sessions with 'Cohort' and 'Session' columns.
+    errors : pandas DataFrame listing sessions that failed to load.
+    """
+    frames, errors = [], []
+    for config_path, session, result in iter_experiments(config_paths, sessions, n_jobs, ordered, **kwargs):
+        if isinstance(result, Exception):
+            print(f'Error loading {session} from {config_path}: {result!r}')
+            errors.append({'config_path': config_path, 'Session': session, 'error': repr(result)})
+            continue
+        result.insert(0, 'Session', session)
+        result.insert(0, 'Cohort', cohort_name(config_path))
+        frames.append(result)
+    df = concat_compact(frames, ignore_index=True) if frames else pd.DataFrame(columns=['Cohort', 'Session'])
+    if kwargs.get('compact') and frames:
+        for col in ['Cohort', 'Session']:
+            df[col] = pd.Categorical(df[col], categories=df[col].unique())
+
+    return df, pd.DataFrame(errors, columns=['config_path', 'Session', 'error'])
+
+
+###################################################################################################
+
+class Experiment:
+    """
+    Cleaned sessions of one experiment (see `load_experiment`).
+
+    Attributes
+    ----------
+    config_path : path to the project yaml file.
+    sessions : dict of session name -> cleaned DataFrame. 'Animal' is categorical with the
+        same categories (`animals.index`) in every session.
+    animals : pandas DataFrame indexed by Animal with the Group/Sex/factor of every animal
+        found in the data (in order of first appearance).
+    errors : dict of session name -> exception for sessions that failed to load.
+    """
+
+    def __init__(self, config_path, sessions, errors=None):
+        self.config_path = config_path
+        self.errors = errors or {}
+        info_cols = ['Animal', 'Sex', 'Group'] + list(load_expt_config(config_path).get('factors') or {})
+        animals = pd.concat([df.reindex(columns=info_cols) for df in sessions.values()]
+                            or [pd.DataFrame(columns=info_cols)])
+        self.animals = (animals.drop_duplicates('Animal')
+                        .set_index('Animal')
+                        .dropna(axis=1, how='all'))
+        self.sessions = {}
+        for session, df in sessions.items():
+            df = df.copy()
+            df['Animal'] = pd.Categorical(df['Animal'], categories=self.animals.index)
+            self.sessions[session] = df
+        self._phase_means = {}
+
+    def __getitem__(self, session):
+        return self.sessions[session]
+
+    def __iter__(self):
+        return iter(self.sessions)
+
+    def __repr__(self):
+        return f'Experiment({cohort_name(self.config_path)!r}, sessions={list(self.sessions)}, animals={len(self.animals)})'
+
+    def to_frame(self):
+        """All sessions in one long DataFrame with a 'Session' column."""
+        df = concat_compact([df.assign(Session=session) for session, df in self.sessions.items()],
+                            ignore_index=True)
+
+        return df[['Session'] + [col for col in df.columns if col != 'Session']]
+
+    def session_phase_means(self, session, yvar='PctFreeze'):
+        """Mean of `yvar` for each animal and 'Phase' of one session (computed once and reused)."""
+        key = (session, yvar)
+        if key not in self._phase_means:
+            self._phase_means[key] = (self.sessions[session]
+                                      .groupby(['Animal', 'Phase'], observed=True, sort=False)[yvar]
+                                      .mean()
+                                      .unstack('Phase'))
+        return self._phase_means[key]
+
+    def phase_means(self, yvar='PctFreeze', sessions=None):
+        """
+        Per-animal phase means across sessions.
+
+        Parameters
+        ----------
+        yvar : column to average (e.g., 'PctFreeze' or 'AvgMotion').
+        sessions : sessions to include (default: all loaded sessions).
+
+        Returns
+        -------
+        means : pandas DataFrame indexed by Animal (all animals in `animals`, NaN where an animal
+            is missing from a session) with ('Session', 'Phase') columns. Join with `animals`
+            to add group info.
+        """
+        sessions = list(self.sessions) if sessions is None else sessions
+        means = pd.concat({session: self.session_phase_means(session, yvar) for session in sessions},
+                          axis=1, names=['Session', 'Phase'])
+
+        return means.reindex(self.animals.index)
+
+
+def load_experiment(config_path, sessions=None, n_jobs=None, **kwargs):
+    """
+    Load every session of one experiment concurrently.
+
+    Sessions are read in a thread pool and the animal info in the config is compiled
+    once and shared by every session.
+
+    Parameters
+    ----------
+    config_path : path to the project yaml file.
+    sessions : sessions to load (default: `sessions` in the config).
+    n_jobs : number of threads (default: one per session).
+    **kwargs : passed to `clean_data`.
+
+    Returns
+    -------
+    expt : Experiment with the cleaned sessions.
+    """
+    expt_info = load_expt_config(config_path)
+    sessions = list(expt_info['sessions'] if sessions is None else sessions)
+    meta = animal_metadata(expt_info)
+    frames, errors = {}, {}
+    with ThreadPoolExecutor(max_workers=n_jobs or len(sessions) or 1) as pool:
+        futures = {session: pool.submit(clean_data, config_path, session, meta=meta, **kwargs)
+                   for session in sessions}
+        for session, future in futures.items():
+            err = future.exception()
+            if err is not None:
+                print(f'Error loading {session} from {config_path}: {err!r}')
+                errors[session] = err
+            else:
+                frames[session] = future.result()
+
+    return Experiment(config_path, frames, errors)
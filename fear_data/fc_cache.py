@@ -0,0 +1,245 @@
+"""
+Caching of parsed VideoFreeze sessions and experiment files.
+* On-disk cache of loaded sessions, enabled by setting `cache_path` in expt_config.yaml.
+* In-process memoization of config and protocol files, invalidated by mtime.
+"""
+import os
+import copy
+import json
+import glob
+import hashlib
+import threading
+from functools import wraps
+from collections import OrderedDict
+from os.path import join, abspath, getsize, getmtime
+import pandas as pd
+
+# config sections that change the output of `load_data`
+CONFIG_KEYS = ['raw_data', 'group_ids', 'sex', 'sex_ids', 'factors']
+# bumped when the cached contents change (v2: parsed file before animal info is added)
+CACHE_VERSION = 'v2'
+CACHE_FORMATS = {'feather': ('.feather', pd.read_feather),
+                 'parquet': ('.parquet', pd.read_parquet)}
+# in-process memo caches, emptied by `clear_cache`
+_MEMO_CACHES = []
+
+
+###################################################################################################
+###################################################################################################
+
+def file_hash(file, chunk_size=1 << 20):
+    """Hash the contents of `file` in fixed size chunks."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(file, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+
+    return h.hexdigest()
+
+
+def config_hash(expt_info, keys=CONFIG_KEYS):
+    """Hash the config sections that affect the loaded data."""
+    cfg = {key: expt_info.get(key) for key in keys}
+    return hashlib.blake2b(json.dumps(cfg, sort_keys=True, default=str).encode(),
+                           digest_size=16).hexdigest()
+
+
+def _entry_key(file, session, cfg_hash):
+    key = '|'.join([abspath(file), session.lower(), cfg_hash, CACHE_VERSION])
+    return hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+
+
+def _read_entry(meta_file):
+    with open(meta_file, 'r') as f:
+        return json.load(f)
+
+
+def _write_json(meta_file, entry):
+    tmp_file = meta_file + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(entry, f)
+    os.replace(tmp_file, meta_file)
+
+
+def _remove_entry(cache_path, entry):
+    for ext in ['.json', entry['ext']]:
+        try:
+            os.remove(join(cache_path, entry['key'] + ext))
+        except FileNotFoundError:
+            pass
+
+
+###################################################################################################
+
+def read_cache(cache_path, file, expt_info, session):
+    """
+    Return the cached DataFrame for `file`/`session`, or None if missing or stale.
+
+    An entry is valid if the file size and mtime are unchanged. If the mtime changed
+    the file is re-hashed, and the entry is kept only if the contents are identical.
+    Entries for the same file with a different size, hash or config are evicted.
+
+    Parameters
+    ----------
+    cache_path : directory holding the cache.
+    file : raw VideoFreeze .csv the entry was created from.
+    expt_info : loaded expt_config.yaml.
+    session : session name.
+
+    Returns
+    -------
+    df : cached pandas DataFrame or None
+    """
+    cfg_hash = config_hash(expt_info)
+    key = _entry_key(file, session, cfg_hash)
+    meta_file = join(cache_path, key + '.json')
+    if not os.path.exists(meta_file):
+        return None
+    entry = _read_entry(meta_file)
+    size, mtime = getsize(file), getmtime(file)
+    if entry['size'] != size:
+        _remove_entry(cache_path, entry)
+        return None
+    if entry['mtime'] != mtime:
+        if entry['hash'] != file_hash(file):
+            _remove_entry(cache_path, entry)
+            return None
+        # contents unchanged (e.g. file was touched), refresh mtime
+        entry['mtime'] = mtime
+        _write_json(meta_file, entry)
+    _, reader = CACHE_FORMATS[entry['format']]
+
+    return reader(join(cache_path, key + entry['ext']))
+
+
+def write_cache(cache_path, file, expt_info, session, df, fmt='feather'):
+    """
+    Store `df` in the cache and evict older entries for the same file and session.
+
+    Parameters
+    ----------
+    cache_path : directory holding the cache.
+    file : raw VideoFreeze .csv the entry was created from.
+    expt_info : loaded expt_config.yaml.
+    session : session name.
+    df : pandas DataFrame to store.
+    fmt : 'feather' or 'parquet' (both require pyarrow).
+    """
+    if fmt not in CACHE_FORMATS:
+        raise ValueError(f'`fmt` must be one of {list(CACHE_FORMATS)}')
+    os.makedirs(cache_path, exist_ok=True)
+    cfg_hash = config_hash(expt_info)
+    key = _entry_key(file, session, cfg_hash)
+    # drop stale entries from other configs
+    evict_cache(cache_path, file=file, session=session)
+    ext, _ = CACHE_FORMATS[fmt]
+    tmp_file = join(cache_path, key + '.tmp' + ext)
+    getattr(df.reset_index(drop=True), f'to_{fmt}')(tmp_file)
+    os.replace(tmp_file, join(cache_path, key + ext))
+    entry = {'key': key,
+             'path': abspath(file),
+             'session': session.lower(),
+             'size': getsize(file),
+             'mtime': getmtime(file),
+             'hash': file_hash(file),
+             'config_hash': cfg_hash,
+             'format': fmt,
+             'ext': ext,
+             'rows': len(df)}
+    _write_json(join(cache_path, key + '.json'), entry)
+
+
+###################################################################################################
+
+def list_cache(cache_path):
+    """
+    List entries in the cache.
+
+    Parameters
+    ----------
+    cache_path : directory holding the cache.
+
+    Returns
+    -------
+    df : pandas DataFrame with one row per cache entry.
+    """
+    cols = ['key', 'path', 'session', 'size', 'mtime', 'hash', 'config_hash', 'format', 'ext', 'rows']
+    entries = [_read_entry(meta) for meta in sorted(glob.glob(join(cache_path, '*.json')))]
+
+    return pd.DataFrame(entries, columns=cols)
+
+
+def evict_cache(cache_path, file=None, session=None):
+    """
+    Remove entries from the cache. With no `file`/`session` the whole cache is cleared.
+
+    Parameters
+    ----------
+    cache_path : directory holding the cache.
+    file : only evict entries created from this raw file.
+    session : only evict entries for this session.
+
+    Returns
+    -------
+    n_evicted : number of entries removed.
+    """
+    n_evicted = 0
+    for meta in glob.glob(join(cache_path, '*.json')):
+        entry = _read_entry(meta)
+        if file is not None and entry['path'] != abspath(file):
+            continue
+        if session is not None and entry['session'] != session.lower():
+            continue
+        _remove_entry(cache_path, entry)
+        n_evicted += 1
+
+    return n_evicted
+
+
+###################################################################################################
+###################################################################################################
+
+def memoize_file(maxsize=32):
+    """Decorator to memoize a function whose first argument is a file path.
+    
+    Results are kept per (file, *args) and recomputed when the file's mtime changes.
+    The least recently used entries are dropped once `maxsize` is reached. A copy of
+    the cached result is returned so callers can't modify the cached object.
+    
+    Parameters
+    ----------
+    maxsize : maximum number of cached results.
+    """
+    def decorator(func):
+        cache = OrderedDict()
+        lock = threading.Lock()
+        _MEMO_CACHES.append((cache, lock))
+
+        @wraps(func)
+        def decorated(file, *args):
+            key = (abspath(file),) + args
+            mtime = getmtime(file)
+            with lock:
+                hit = cache.get(key)
+                if hit is not None and hit[0] == mtime:
+                    cache.move_to_end(key)
+                    return copy.deepcopy(hit[1])
+            result = func(file, *args)
+            with lock:
+                cache[key] = (mtime, result)
+                cache.move_to_end(key)
+                while len(cache) > maxsize:
+                    cache.popitem(last=False)
+
+            return copy.deepcopy(result)
+
+        return decorated
+
+    return decorator
+
+
+def clear_cache():
+    """Empty the in-process config and protocol file caches."""
+    for cache, lock in _MEMO_CACHES:
+        with lock:
+            cache.clear()
@@ -1,11 +1,12 @@
-import csv
 import re
+import csv
 import os
 from os.path import join
 from pathlib import Path
 import yaml
 import pandas as pd
 import numpy as np
+from . import fc_cache, fc_profile
 
 
 ###################################################################################################
@@ -20,61 +21,205 @@ def load_expt_config(config_path):
      Returns
      -------
      expt_info : YAML object
+     
+     Notes
+     -----
+     The parsed config is cached until the file is modified (see `fc_cache.clear_cache`).
     """
     try: 
-        with open (config_path, 'r') as file:
-            expt = yaml.safe_load(file)
+        expt = _read_config(config_path)
     except Exception:
         print('Error reading the config file')
 
     return expt
 
 
+@fc_cache.memoize_file()
+def _read_config(config_path):
+    with open (config_path, 'r') as file:
+        return yaml.safe_load(file)
+
+
 ###################################################################################################
 
-def load_data(config_path, session):
-    """loads .csv from VideoFreeze as a pandas df
+# VideoFreeze metadata rows -> (header key, type)
+HEADER_FIELDS = {'Date': ('date', str),
+                 'Motion Threshold': ('motion_threshold', float),
+                 'Detection Method': ('detection_method', str),
+                 'Min Freeze Duration': ('min_freeze_duration', int)}
+COMP_COLS = ['Component', 'start', 'duration', 'start_frame', 'duration_frames']
+
+
+def _vf_time(time_str):
+    """Convert a VideoFreeze 'Start Time' string (e.g. ' 0:04:20.000') to seconds."""
+    secs = 0.0
+    for val in time_str.strip().split(':'):
+        secs = secs * 60 + float(val)
+    return secs
 
+
+def scan_header(f, start_row='Experiment'):
+    """Scan the metadata rows of an open VideoFreeze .csv until the data table starts.
+    
+    Only the header lines are read. On return `f` is positioned at the start of the
+    data table (the row containing `start_row`), so it can be passed straight to `pd.read_csv`.
+    
     Parameters
     ----------
-    config_path : path to the project yaml file.
-    session : the session to load data from the config_file
+    f : file object opened in text mode.
+    start_row : label marking the first row of real data (default: 'Experiment').
     
     Returns
     -------
-    df : pandas DataFrame of data from the specified session.
+    header : dict with 'date', 'motion_threshold', 'detection_method', 'min_freeze_duration'
+        and 'components' (DataFrame of the 'Component Details' table with 'Component', 'start',
+        'duration', 'start_frame', 'duration_frames' and 'end'; times in seconds).
     """
-    expt_info = load_expt_config(config_path)
-    # raise execption if input for session not in config file.
-    if session.lower() not in expt_info['sessions']:
-        raise ValueError("`session` not found in sessions list - check expt_config.yaml")
+    header = {key: None for key, _ in HEADER_FIELDS.values()}
+    comp_rows = []
+    in_comps = False
+    while True:
+        pos = f.tell()
+        line = f.readline()
+        if not line:
+            raise ValueError(f'could not find "{start_row}" row in VideoFreeze file')
+        row = next(csv.reader([line]))
+        cells = [cell for cell in row if cell.strip()]
+        if any(cell.startswith(start_row) for cell in cells):
+            f.seek(pos)
+            break
+        if not cells:
+            in_comps = False
+        elif cells[0].startswith('Component Details'):
+            in_comps = True
+        elif in_comps and cells[0] != 'Component Name':
+            comp_rows.append([cells[0].strip(), _vf_time(cells[1])] + [float(val) for val in cells[2:5]])
+        else:
+            for label, (key, dtype) in HEADER_FIELDS.items():
+                if cells[0].startswith(label) and len(cells) > 1:
+                    header[key] = dtype(cells[1].strip())
+
+    comps = pd.DataFrame(comp_rows, columns=COMP_COLS)
+    comps[['start_frame', 'duration_frames']] = comps[['start_frame', 'duration_frames']].astype('int64')
+    comps['end'] = comps['start'] + comps['duration']
+    header['components'] = comps
+
+    return header
+
+
+def read_header(file):
+    """Read only the metadata rows of a VideoFreeze .csv (see `scan_header`)."""
+    with open(file, 'rt') as f:
+        return scan_header(f)
+
+
+def read_vf_csv(file, **kwargs):
+    """Read a VideoFreeze .csv in a single pass.
     
-    # find session file
-    data_path = expt_info['raw_data_path'] if expt_info['raw_data'] else expt_info['proc_data_path']
-    file = join(data_path, expt_info[f'{session.lower()}_file'])
-    # internal function
-    def find_start(file, start_row='Experiment'):
-        """Uses regex to find the first row of real data. This function is used as part
-        of the load_df function.
-
-        Parameters
-        ----------
-        file: path to the .csv to be loaded
-        """
-        with open(file, 'rt') as f:
-            reader = csv.reader(f)
-            test = [row for row in reader]
-        line_num = 0
-        for index in test:
-            for double_index in index:
-                if re.match(start_row,double_index) != None:
-                    return(line_num)
-            line_num+=1
-
-    # convert training file to pandas df
-    df = pd.read_csv(file, skiprows=find_start(file))
+    The metadata rows are scanned line by line and the open file is handed directly to
+    the C parser for the data table, so the file is only read once.
+    
+    Parameters
+    ----------
+    file : path to the .csv to be loaded
+    **kwargs : passed to `pd.read_csv`.
+    
+    Returns
+    -------
+    df : pandas DataFrame of the raw data table.
+    header : dict of session metadata from `scan_header`.
+    """
+    with open(file, 'rt') as f:
+        with fc_profile.stage('read_vf_csv.header_scan'):
+            header = scan_header(f)
+        with fc_profile.stage('read_vf_csv.csv_parse') as st:
+            df = pd.read_csv(f, engine='c', **kwargs)
+            st.rows_out = len(df)
+
+    return df, header
+
+
+###################################################################################################
+
+def animal_metadata(expt_info):
+    """
+    Compile the animal info in the config into a table indexed by Animal.
+    
+    Parameters
+    ----------
+    expt_info : loaded expt_config.yaml. Uses `group_ids`, `sex_ids` (if `sex` is True)
+        and any additional factors listed under `factors` (e.g. virus, box).
+    
+    Returns
+    -------
+    meta : pandas DataFrame indexed by 'Animal' with one column per factor.
+    """
+    factors = {'Group': expt_info.get('group_ids') or {}}
+    if expt_info.get('sex') is True:
+        factors['Sex'] = expt_info.get('sex_ids') or {}
+    factors.update(expt_info.get('factors') or {})
+    # later entries take precedence if an animal is listed twice
+    meta = pd.DataFrame({factor: pd.Series({str(animal): level
+                                            for level, animals in (levels or {}).items()
+                                            for animal in (animals or []) if str(animal)},
+                                           dtype=object)
+                         for factor, levels in factors.items()})
+    meta.index.name = 'Animal'
+
+    return meta
+
+
+def add_metadata(df, meta, verbose=True):
+    """
+    Add animal info from `animal_metadata` to each row of `df` in one vectorized lookup.
+    
+    Animals not listed for 'Group' keep the Group from the VideoFreeze file.
+    
+    Parameters
+    ----------
+    df : pandas DataFrame with an 'Animal' column.
+    meta : animal info table from `animal_metadata`.
+    verbose : if True, print animals found in only one of `df` or `meta`.
+    
+    Returns
+    -------
+    df : pandas DataFrame with a column for each factor in `meta`.
+    """
+    idx = meta.index.get_indexer(df['Animal'])
+    found = idx >= 0
+    for col in meta.columns:
+        vals = meta[col].to_numpy(dtype=object)[idx]
+        vals[~found] = np.nan
+        if col == 'Group' and 'Group' in df:
+            vals = np.where(pd.isna(vals), df['Group'].to_numpy(dtype=object), vals)
+        df[col] = vals
+    if verbose:
+        not_in_cfg = pd.unique(df['Animal'].to_numpy()[~found])
+        not_in_data = meta.index[np.bincount(idx[found], minlength=len(meta)) == 0]
+        if len(not_in_cfg):
+            print(f'Animals not found in config: {list(not_in_cfg)}')
+        if len(not_in_data):
+            print(f'Animals in config not found in data: {list(not_in_data)}')
+
+    return df
+
+
+###################################################################################################
+
+def format_vf_data(df):
+    """
+    Drop empty rows from a raw VideoFreeze data table and keep the columns used for analysis.
+    
+    Parameters
+    ----------
+    df : pandas DataFrame of the raw data table (see `read_vf_csv`).
+    
+    Returns
+    -------
+    df : pandas DataFrame with 'Animal', 'Group', 'Component', 'PctFreeze' and 'AvgMotion' columns.
+    """
     # drop NaNs that can get inserted into
-    df = df.replace('nan', np.NaN).dropna(thresh=2).reset_index()   
+    df = df.replace('nan', np.nan).dropna(thresh=2).reset_index(drop=True)
     # bug from VideoFreeze on some csv files, convert Animal to str
     if df['Animal'].dtype is np.dtype('float64') or df['Animal'].dtype is np.dtype('int64'):
         df.loc[:, 'Animal'] = df['Animal'].astype('int').astype('str')  
@@ -85,23 +230,82 @@ def load_data(config_path, session):
     # rename columns to remove spaces in colnames
     new_col_list = ['Animal', 'Group', 'Component', 'PctFreeze', 'AvgMotion']
     new_cols = {key:val for (key,val) in zip(df.reindex(columns=old_col_list).columns, new_col_list)}
-    df = df.rename(columns=new_cols) 
+    df = df.rename(columns=new_cols)
+
+    return df
+
+
+###################################################################################################
+
+def session_file(expt_info, session):
+    """Path to the VideoFreeze file for `session` in the loaded config."""
+    # raise execption if input for session not in config file.
+    if session.lower() not in expt_info['sessions']:
+        raise ValueError("`session` not found in sessions list - check expt_config.yaml")
+    data_path = expt_info['raw_data_path'] if expt_info['raw_data'] else expt_info['proc_data_path']
+
+    return join(data_path, expt_info[f'{session.lower()}_file'])
+
+
+def load_data(config_path, session, return_header=False, compact=False, meta=None):
+    """loads .csv from VideoFreeze as a pandas df
+
+    Parameters
+    ----------
+    config_path : path to the project yaml file.
+    session : the session to load data from the config_file
+    return_header : if True, also return the session metadata (see `scan_header`).
+    compact : if True, return categorical ID columns and float32 measures (see `compact_df`).
+    meta : (optional) animal info from `animal_metadata`, to reuse it across sessions
+        (compiled from the config if not given).
+    
+    Returns
+    -------
+    df : pandas DataFrame of data from the specified session.
+    header : dict of session metadata (only if `return_header` is True).
+    
+    Notes
+    -----
+    If `cache_path` is set in the config, the parsed file (before animal info is added)
+    is stored there (see `fc_cache`) and reused until the raw file or group info changes.
+    """
+    expt_info = load_expt_config(config_path)
+    # find session file
+    file = session_file(expt_info, session)
+    # reuse parsed session if caching is enabled in the config
+    cache_path = expt_info.get('cache_path')
+    df, header = None, None
+    if cache_path:
+        with fc_profile.stage('load_data.cache_read') as st:
+            df = fc_cache.read_cache(cache_path, file, expt_info, session)
+            st.rows_out = None if df is None else len(df)
+    if df is None:
+        # convert training file to pandas df
+        df, header = read_vf_csv(file)
+        with fc_profile.stage('load_data.nan_cleanup', rows_in=len(df)) as st:
+            df = format_vf_data(df)
+            st.rows_out = len(df)
+        # cache the parsed file before animal info is added, so `meta` never ends up in the cache
+        if cache_path:
+            with fc_profile.stage('load_data.cache_write', rows_in=len(df)):
+                fc_cache.write_cache(cache_path, file, expt_info, session, df,
+                                     fmt=expt_info.get('cache_format', 'feather'))
+    elif return_header:
+        header = read_header(file)
     
     # Fill in Group info    
-    expt_cfg = load_expt_config(config_path)
-    mouseDict = expt_cfg['group_ids']
-    for key,val in mouseDict.items():
-        df.loc[df['Animal'].isin(val), 'Group'] = key
-    if expt_cfg['sex'] is True:
-        for key, val in expt_cfg['sex_ids'].items():
-            df.loc[df['Animal'].isin(val), 'Sex'] = key
+    with fc_profile.stage('load_data.group_mapping', rows_in=len(df)) as st:
+        df = add_metadata(df, animal_metadata(expt_info) if meta is None else meta)
+        st.rows_out = len(df)
+    if compact:
+        df = compact_df(df)
     
-    return df
+    return (df, header) if return_header else df
 
 
 ###################################################################################################
 
-def clean_data(config_path, session, prism_format=False, prism_col='Component'):
+def clean_data(config_path, session, prism_format=False, prism_col='Component', compact=False, meta=None):
     """
     Cleans video fear data files by converting animal ids to strings,
     simplifying component names, and adding phase names (if trace or tone fear).
@@ -112,53 +316,191 @@ def clean_data(config_path, session, prism_format=False, prism_col='Component'):
     session : the session to load data from the config_file
     prism_format : if `True` will convert the data into long-format for use in Prism.
     prism_col : column to use for data labels if prim_format == True.
+    compact : if True, return categorical ID columns and float32 measures (see `compact_df`).
+    meta : (optional) animal info from `animal_metadata` (see `load_data`).
     
     Returns
     -------
     df : cleaned DataFrame with 'Phase' labeled.
     """
     
-    def get_baseline_vals(df):
-        """ Get values up to the first 'tone' component"""
-        new_list = []
-        for item in df['Component']:
-            if item.lower() != 'tone-1':
-                new_list.append(item)
-            else:
-                break
-        new_list = [str(item) for item in new_list]
-        return new_list
-
     # load session data
-    df = load_data(config_path, session)
+    df = load_data(config_path, session, meta=meta)
     # clean up df
-    if session is 'context':
-        df['Component'] = df['Component'].astype('int')
-        df['Phase'] = 'context'
-    else:
-        df['Component'] = [ df['Component'][x].lower() for x in range(len(df['Component'])) ]
-        df['Phase'] = df['Component']
-        baseline_vals = get_baseline_vals(df)
-        # add column to denote phase of each bin   
-        df.loc[df['Phase'].isin(baseline_vals), 'Phase'] = 'baseline'
-        df.loc[df['Phase'].str.contains('tone'), 'Phase'] = 'tone'
-        df.loc[df['Phase'].str.contains('trace'), 'Phase'] = 'trace'
-        df.loc[~df['Phase'].isin(['baseline', 'tone', 'trace']), 'Phase'] = 'iti'
+    with fc_profile.stage('clean_data.phase_labeling', rows_in=len(df)) as st:
+        df = label_phases(df, session, load_expt_config(config_path).get('phase_rules'))
+        st.rows_out = len(df)
+    if compact:
+        df = compact_df(df)
     
     if prism_format is True:
+        df = prism_table(df, prism_col)
+    else:
+        df = df.reindex(columns=clean_columns(load_expt_config(config_path)))
+        
+    return df
+
+
+def prism_table(df, prism_col='Component'):
+    """
+    Wide table of mean PctFreeze per animal (rows, sorted by 'Group') and `prism_col` value
+    (columns, in order of appearance), for use in Prism.
+    """
+    with fc_profile.stage('clean_data.pivot', rows_in=len(df)) as st:
         col_order = df[prism_col].unique()
-        df = df.pivot_table(values='PctFreeze', index=['Animal', 'Group'], columns=prism_col)
+        df = df.pivot_table(values='PctFreeze', index=['Animal', 'Group'], columns=prism_col, observed=True)
         df = (df
               .reindex(col_order, axis=1)
               .sort_values('Group')
               .reset_index() )
-    else:
-        df = df.reindex(columns=['Animal', 'Sex', 'Group', 'Phase', 
-                               'Component', 'PctFreeze', 'AvgMotion'])
-        
+        st.rows_out = len(df)
+
+    return df
+
+
+###################################################################################################
+
+def label_phases(df, session, phase_rules=None):
+    """
+    Simplify component names and add the 'Phase' (baseline, tone, trace, iti or context) of each bin.
+    
+    Each unique component name is classified once and the result is broadcast to every
+    row through the factorized codes, so the cost scales with the number of unique components.
+    
+    Parameters
+    ----------
+    df : pandas DataFrame from `load_data`.
+    session : the session `df` was loaded from.
+    phase_rules : (optional) dict of phase -> regular expression matched against the lowercase
+        component names (e.g., `phase_rules` in the config). The first matching rule wins and
+        components that match no rule get the default phase.
+    
+    Returns
+    -------
+    df : pandas DataFrame with 'Phase' labeled.
+    
+    Notes
+    -----
+    By default, components that appear before the first 'tone-1' are 'baseline', names
+    containing 'tone' or 'trace' are 'tone' or 'trace' and everything else is 'iti'.
+    """
+    if session.lower() == 'context':
+        df['Component'] = df['Component'].astype('int')
+        df['Phase'] = 'context'
+        return df
+
+    codes, uniques = pd.factorize(df['Component'])
+    # merge names that only differ in case (factorize keeps order of first appearance)
+    lower_codes, names = pd.factorize(pd.Index(uniques).astype(str).str.lower())
+    codes = np.where(codes >= 0, lower_codes[codes], -1)
+    n_baseline = names.get_loc('tone-1') if 'tone-1' in names else len(names)
+    phases = []
+    for i, name in enumerate(names):
+        phase = 'baseline' if i < n_baseline else name
+        if 'tone' in phase:
+            phase = 'tone'
+        if 'trace' in phase:
+            phase = 'trace'
+        if phase not in ['baseline', 'tone', 'trace']:
+            phase = 'iti'
+        for rule, pattern in (phase_rules or {}).items():
+            if re.search(pattern, name):
+                phase = rule
+                break
+        phases.append(phase)
+    df['Component'] = np.append(np.asarray(names, dtype=object), np.nan)[codes]
+    df['Phase'] = np.append(np.asarray(phases, dtype=object), np.nan)[codes]
+
+    return df
+
+
+def clean_columns(expt_info):
+    """Columns (in order) of the DataFrame returned by `clean_data`."""
+    factors = list(expt_info.get('factors') or {})
+    return ['Animal', 'Sex', 'Group'] + factors + ['Phase', 'Component', 'PctFreeze', 'AvgMotion']
+
+
+###################################################################################################
+
+# columns whose categories keep the order they appear in (protocol order)
+PROTOCOL_COLS = ['Component', 'Phase', 'epoch']
+MEASURE_COLS = ['PctFreeze', 'AvgMotion']
+
+
+def compact_df(df):
+    """
+    Store repeated strings as categoricals and measures as float32.
+    
+    Parameters
+    ----------
+    df : pandas DataFrame (e.g., from `load_data` or `clean_data`).
+    
+    Returns
+    -------
+    df : copy of `df` where every text column is categorical and 'PctFreeze'/'AvgMotion'
+        are float32. 'Component' and 'Phase' are ordered categoricals in the order they first
+        appear (protocol order); other columns (Animal, Group, Sex, factors) have sorted categories.
+    
+    Notes
+    -----
+    Groupby with categorical keys includes unobserved categories unless `observed=True`,
+    as used in `total_df`.
+    """
+    df = df.copy()
+    for col in df.columns:
+        if col in MEASURE_COLS:
+            df[col] = df[col].astype('float32')
+        elif col in PROTOCOL_COLS and df[col].dtype == object:
+            df[col] = pd.Categorical(df[col], categories=df[col].dropna().unique(), ordered=True)
+        elif df[col].dtype == object:
+            df[col] = df[col].astype('category')
+
     return df
 
 
+def concat_compact(frames, **kwargs):
+    """
+    Concatenate DataFrames, keeping columns that are categorical in every frame categorical.
+    
+    `pd.concat` converts categoricals with different categories back to object; here their
+    categories are merged first (in order of appearance across frames).
+    
+    Parameters
+    ----------
+    frames : list of pandas DataFrames.
+    **kwargs : passed to `pd.concat`.
+    
+    Returns
+    -------
+    df : concatenated pandas DataFrame.
+    """
+    frames = list(frames)
+    cat_cols = [col for col in pd.unique(np.concatenate([frame.columns for frame in frames]))
+                if all(isinstance(frame[col].dtype, pd.CategoricalDtype) for frame in frames if col in frame)]
+    for col in cat_cols:
+        cats = pd.unique(np.concatenate([frame[col].cat.categories.to_numpy(dtype=object)
+                                         for frame in frames if col in frame]))
+        frames = [frame.assign(**{col: frame[col].cat.set_categories(cats)}) if col in frame else frame
+                  for frame in frames]
+
+    return pd.concat(frames, **kwargs)
+
+
+def memory_report(df):
+    """
+    Memory used by each column of `df`, counting the strings held by object columns.
+    
+    Returns
+    -------
+    report : pandas DataFrame indexed by column with 'dtype' and 'mb', plus a 'total' row.
+    """
+    mem = df.memory_usage(index=False, deep=True)
+    report = pd.DataFrame({'dtype': df.dtypes.astype(str), 'mb': mem / 1e6})
+    report.loc['total'] = ['', mem.sum() / 1e6]
+
+    return report
+
+
 ###################################################################################################
 
 def total_df(df, hue=None):
@@ -175,30 +517,121 @@ def total_df(df, hue=None):
     df : pandas DataFrame grouped by Phase
     """
     if hue is not None:
-        return df.groupby(['Animal', hue, 'Phase'], as_index=False).mean()
+        return df.groupby(['Animal', hue, 'Phase'], as_index=False, observed=True).mean()
     else:
-        return df.groupby(['Animal', 'Phase'], as_index=False).mean()
+        return df.groupby(['Animal', 'Phase'], as_index=False, observed=True).mean()
+
+
+###################################################################################################
+
+# values drawn per bootstrap batch in `summary_stats` (~32 MB per float64 array)
+BOOT_CHUNK = 1 << 22
+
 
+def summary_stats(df, xvar, yvar='PctFreeze', hue=None, n_boot=0, ci=68, seed=None):
+    """
+    Mean, SEM and n of `yvar` for each `xvar` (and `hue`) level, computed in one grouped pass.
+    
+    Parameters
+    ----------
+    df : pandas DataFrame (e.g., from `clean_data` or `total_df`).
+    xvar : column to group by (e.g., 'Component' or 'Phase').
+    yvar : column to summarize (default: 'PctFreeze').
+    hue : (optional) additional grouping column.
+    n_boot : number of bootstrap resamples for `ci` (default: 0, no bootstrap).
+    ci : size of the bootstrap confidence interval (%).
+    seed : seed for the bootstrap random number generator.
+    
+    Returns
+    -------
+    stats : pandas DataFrame with `xvar`, `hue`, 'mean', 'sem', 'n' and (if `n_boot` > 0)
+        'ci_low' and 'ci_high' columns. Levels are in category order for categorical columns,
+        sorted for numeric columns and in order of appearance otherwise.
+    
+    Notes
+    -----
+    The bootstrap pads cells to the size of the largest one and resamples as many cells at
+    a time as fit in `BOOT_CHUNK` values (n_boot * max_n values per cell).
+    """
+    def factorize(col):
+        if isinstance(col.dtype, pd.CategoricalDtype):
+            return col.cat.codes.to_numpy(), col.cat.categories
+        return pd.factorize(col, sort=pd.api.types.is_numeric_dtype(col))
+
+    keys = [xvar] if hue is None else [xvar, hue]
+    vals = df[yvar].to_numpy(dtype='float64')
+    keep = ~np.isnan(vals)
+    codes, levels = zip(*[factorize(df[key]) for key in keys])
+    keep &= np.all([code >= 0 for code in codes], axis=0)
+    sizes = [len(level) for level in levels]
+    cell = np.ravel_multi_index([code[keep] for code in codes], sizes)
+    vals = vals[keep]
+    n_cells = int(np.prod(sizes))
+    n = np.bincount(cell, minlength=n_cells)
+    total = np.bincount(cell, weights=vals, minlength=n_cells)
+    sumsq = np.bincount(cell, weights=vals ** 2, minlength=n_cells)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / n
+        var = (sumsq - n * mean ** 2) / (n - 1)
+        sem = np.sqrt(np.maximum(var, 0) / n)
+    idx = np.unravel_index(np.arange(n_cells), sizes)
+    stats = pd.DataFrame({key: np.asarray(level)[i] for key, level, i in zip(keys, levels, idx)})
+    stats['mean'], stats['sem'], stats['n'] = mean, sem, n
+    if n_boot > 0:
+        # pad each cell's values into a row of a (n_cells, max_n) array
+        order = np.argsort(cell, kind='stable')
+        pos = np.arange(len(cell)) - np.repeat(np.cumsum(n) - n, n)
+        padded = np.full((n_cells, max(n.max(), 1)), np.nan)
+        padded[cell[order], pos] = vals[order]
+        rng = np.random.default_rng(seed)
+        # only the first n draws of each cell are part of its resample
+        in_cell = np.arange(padded.shape[1]) < n[:, None]
+        boot_means = np.empty((n_cells, n_boot))
+        # resample a bounded number of cells at a time
+        step = max(1, BOOT_CHUNK // (n_boot * padded.shape[1]))
+        for first in range(0, n_cells, step):
+            cells = np.arange(first, min(first + step, n_cells))
+            draws = (rng.random((len(cells), n_boot, padded.shape[1])) * n[cells, None, None]).astype(int)
+            boot = padded[cells[:, None, None], draws]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                boot_means[cells] = np.where(in_cell[cells, None, :], boot, 0).sum(axis=2) / n[cells, None]
+        stats['ci_low'] = np.percentile(boot_means, 50 - ci / 2, axis=1)
+        stats['ci_high'] = np.percentile(boot_means, 50 + ci / 2, axis=1)
+
+    return stats[stats['n'] > 0].reset_index(drop=True)
 
 
 ###################################################################################################
 
-def tfc_comp_times(df, session):
+def tfc_comp_times(df, session, header=None, comp_labs_file=None):
     """
-    Load component times from 'TFC phase components.xlsx'
+    Get the start and end time of each protocol phase (baseline, tone, trace, shock, iti).
     
     Parameters
     ----------
-    config_path : path to the project yaml file.
+    df : pandas DataFrame of session data.
     session : the session to label.
+    header : session metadata from `load_data(..., return_header=True)`. Phase times are
+        taken from its 'Component Details' table.
+    comp_labs_file : (optional) .xlsx file with a 'train' and 'tone' sheet listing the
+        'phase', 'start' and 'end' of each phase. Overrides `header` if given.
     
     Returns
     -------
-    comp_labs : pandas DataFrame grouped by Phase.
+    comp_labs : pandas DataFrame with 'phase', 'start' and 'end' columns.
+    
+    Notes
+    -----
+    If neither `header` nor `comp_labs_file` are given, times are read from the
+    bundled 'TFC phase components.xlsx'. Each sheet is only read once per process
+    unless the file is modified.
     """
+    if comp_labs_file is None and header is not None and len(header['components']):
+        return header_comp_times(header['components'])
     
-    curr_dir = str(Path(__file__).parents[1]) + '/files/'
-    comp_labs_file = curr_dir + 'TFC phase components.xlsx'
+    if comp_labs_file is None:
+        curr_dir = str(Path(__file__).parents[1]) + '/files/'
+        comp_labs_file = curr_dir + 'TFC phase components.xlsx'
 
     if 'train' in session.lower():
         protoc = 'train'
@@ -207,13 +640,55 @@ def tfc_comp_times(df, session):
     else:
         raise ValueError('session must include "train" or "tone"')
     # load TFC phase components.xlsx file
-    comp_labs = pd.read_excel(comp_labs_file, sheet_name=protoc)
+    comp_labs = _read_comp_labs(comp_labs_file, protoc)
     
     return comp_labs
+
+
+def header_comp_times(components, tol=1e-6):
+    """
+    Build the phase table from a session's 'Component Details' table.
+    
+    'Tone-n' and 'Trace-n' components become 'tone-0n' and 'trace-0n', components before
+    the first tone are 'baseline' and those after trial n are 'iti-0n'. A gap following a
+    trace component (no recording during the shock) is labeled 'shock-0n'. Consecutive
+    components with the same label are merged into one phase.
+    
+    Parameters
+    ----------
+    components : pandas DataFrame from `scan_header` (header['components']).
+    tol : tolerance (sec) used to detect gaps between components.
+    
+    Returns
+    -------
+    comp_labs : pandas DataFrame with 'phase', 'start' and 'end' columns.
+    """
+    names = components['Component'].astype(str).str.lower()
+    kind = names.str.extract(r'^(tone|trace)-(\d+)$')
+    trial = kind[1].astype('float64').ffill()
+    labels = np.where(kind[0].notna(), kind[0] + '-' + trial.map('{:02.0f}'.format),
+                      np.where(trial.isna(), 'baseline', 'iti-' + trial.map('{:02.0f}'.format)))
+    starts = components['start'].to_numpy(dtype='float64')
+    ends = components['end'].to_numpy(dtype='float64')
+    # insert shock phases in gaps after trace components
+    gap = np.append(starts[1:] > ends[:-1] + tol, False) & (kind[0] == 'trace').to_numpy()
+    gap_pos = np.flatnonzero(gap) + 1
+    labels = np.insert(labels.astype(object), gap_pos, ['shock-' + lab.split('-')[1] for lab in labels[gap_pos - 1]])
+    starts, ends = np.insert(starts, gap_pos, ends[gap_pos - 1]), np.insert(ends, gap_pos, starts[gap_pos])
+    # merge consecutive components with the same label
+    first = np.flatnonzero(np.append(True, labels[1:] != labels[:-1]))
+    last = np.append(first[1:] - 1, len(labels) - 1)
+
+    return pd.DataFrame({'phase': labels[first], 'start': starts[first], 'end': ends[last]})
+
+
+@fc_cache.memoize_file()
+def _read_comp_labs(comp_labs_file, sheet_name):
+    return pd.read_excel(comp_labs_file, sheet_name=sheet_name)
     
 ###################################################################################################
 
-def label_fc_data(config_path, session):
+def label_fc_data(config_path, session, comp_labs_file=None):
     """
     * Load fear conditioning data from corresponding session.
     * Used primarily on data with high temporal resolution (e.g., <1 sec per component).
@@ -222,26 +697,103 @@ def label_fc_data(config_path, session):
     ----------
     config_path : path to the project yaml file.
     session : the session to label.
+    comp_labs_file : (optional) .xlsx file of phase times to use instead of the file's
+        'Component Details' (can also be set with `comp_labs_file` in the config).
     
     Returns
     -------
-    df : pandas DataFrame with 'Component' giving session time and 'epoch' the labeled component.
+    df : pandas DataFrame with 'Component' giving session time and 'epoch' the labeled component
+        (categorical, see `label_epochs`).
     """
-    df = load_data(config_path, session)
-    comp_labs = tfc_comp_times(df, session)
+    df, _ = _label_session(config_path, session, comp_labs_file)
+    
+    return df
+
+
+def _label_session(config_path, session, comp_labs_file=None, data=None):
+    """
+    Label session data with `label_fc_data` and return the phase times used.
+    `data` is an already loaded (df, header) from `load_data` (the df is not modified).
+    """
+    if data is None:
+        df, header = load_data(config_path, session, return_header=True)
+    else:
+        df, header = data[0].copy(), data[1]
+    if comp_labs_file is None:
+        comp_labs_file = load_expt_config(config_path).get('comp_labs_file')
+    with fc_profile.stage('label_fc_data.comp_times'):
+        comp_labs = tfc_comp_times(df, session, header=header, comp_labs_file=comp_labs_file)
     # add time labels as component labels
+    with fc_profile.stage('label_fc_data.session_times', rows_in=len(df)) as st:
+        df['Component'] = session_times(df, comp_labs, None if comp_labs_file else header['components'])
+        st.rows_out = len(df)
+    # label the TFC components
+    with fc_profile.stage('label_fc_data.epoch_labeling', rows_in=len(df)) as st:
+        df['epoch'] = label_epochs(df['Component'], comp_labs)
+        st.rows_out = len(df)
+    
+    return df, comp_labs
+
+
+def session_times(df, comp_labs, components=None):
+    """
+    Session time (sec) of each bin, counting bins separately for each animal.
+    
+    Parameters
+    ----------
+    df : pandas DataFrame of session data.
+    comp_labs : phase table from `tfc_comp_times`.
+    components : (optional) 'Component Details' table from the file header. If given (and it
+        covers every bin), the start time of each component is used.
+    
+    Returns
+    -------
+    times : ndarray of session times rounded to 0.01 sec. Without `components`, bins are
+        equally spaced over the session.
+    """
     n_components = len(df.query('Animal == @df.Animal.unique()[0]'))
+    bin_no = df.groupby('Animal', sort=False).cumcount().to_numpy()
+    if components is not None and bin_no.max() < len(components):
+        # use start time of each component from the file
+        return np.around(components['start'].to_numpy(dtype='float64')[bin_no], 2)
+    # equally spaced over the session for each animal
     session_end = max(comp_labs['end'])
-    df['Component'] = np.tile(np.linspace(0, session_end, n_components), len(df.Animal.unique()))
-    #df['Component'] = round(df['Component'].astype('float64'), 2)
-    df['Component'] = np.around(df['Component'].astype('float64'), 2)
-    df['epoch'] = df['Component']
-    # label the TFC components
-    for i in range(len(comp_labs['phase'])):
-        df.loc[df['Component'].between(comp_labs['start'][i], comp_labs['end'][i]), 'epoch'] = comp_labs['phase'][i]
-    # label tone, trace, and iti for all protocols
+    return np.around(bin_no * (session_end / (n_components - 1)), 2)
+
+
+def label_epochs(times, comp_labs, tol=1e-6):
+    """
+    Label each time with the phase whose [start, end] interval contains it.
     
-    return df
+    Interval boundaries are located once with `searchsorted` on the sorted unique times,
+    then broadcast back to every row, so the cost per row does not depend on the number of phases.
+    
+    Parameters
+    ----------
+    times : array-like of session times (sec).
+    comp_labs : pandas DataFrame with 'phase', 'start' and 'end' columns (see `tfc_comp_times`).
+    tol : tolerance used when comparing times to interval boundaries.
+    
+    Returns
+    -------
+    epoch : pandas Categorical of phase labels (categories in protocol order).
+    
+    Notes
+    -----
+    Intervals include both boundaries. Where intervals overlap, the later row of `comp_labs`
+    takes precedence. Times not covered by any interval are labeled NaN.
+    """
+    uniq_times, inv = np.unique(np.asarray(times, dtype='float64'), return_inverse=True)
+    phases = comp_labs['phase'].astype(str).to_numpy()
+    categories = pd.unique(phases)
+    phase_codes = pd.Index(categories).get_indexer(phases)
+    lo = np.searchsorted(uniq_times, comp_labs['start'].to_numpy(dtype='float64') - tol, side='left')
+    hi = np.searchsorted(uniq_times, comp_labs['end'].to_numpy(dtype='float64') + tol, side='right')
+    codes = np.full(len(uniq_times), -1)
+    for code, start, end in zip(phase_codes, lo, hi):
+        codes[start:end] = code
+
+    return pd.Categorical.from_codes(codes[inv], categories=categories)
 
 ###################################################################################################
 
@@ -263,25 +815,223 @@ def tfc_trials_df(config_path, session='train', win_start=-20, win_end=60):
     df : pandas DataFrame of trial-level data
     """
     
-    df = label_fc_data(config_path, session)    
-    comp_labs = tfc_comp_times(df, session)
+    df, comp_labs = _label_session(config_path, session)
+    
+    return window_trials(df, comp_labs, win_start, win_end)
+
+
+def window_trials(df, comp_labs, win_start=-20, win_end=60):
+    """
+    Add 'Trial' and 'trial_time' to labeled session data and drop bins outside every trial window.
+    
+    Parameters
+    ----------
+    df : pandas DataFrame from `label_fc_data`.
+    comp_labs : phase table used to label `df` (see `tfc_comp_times`).
+    win_start : start of window for each trial (Note: tone onset is t=0)
+    win_end : end of window for each trial (Note: tone onset is t=0)
+    
+    Returns
+    -------
+    df : pandas DataFrame of trial-level data. 'trial_time' is the time of each bin (sec)
+        relative to the tone onset of its trial.
+    """
     # create list of tone values
     trials_idx = [ tone for tone in range(len(comp_labs['phase'])) if 'tone' in comp_labs['phase'][tone] ]
-    # determine number of tone trials from label
-    n_subjects = len(df['Animal'].unique())
-    n_trials = len(trials_idx)
     trial_no = int(1)
-    # subset trial data (-20 prior to CS --> 40s after trace/shock)
-    for tone in trials_idx:
-        start = comp_labs.loc[tone,'start'] + win_start
-        end = comp_labs.loc[tone,'start'] + win_end
-        df.loc[(start <= df.Component) & (df.Component <= end), 'Trial'] = int(trial_no)
-        trial_no += 1
-    #drop time rows outside of (win_start,win_end) trial window    
-    df = df.dropna().reset_index(drop=True)
-    df['Trial'] = df['Trial'].astype(int)
-    # add equally spaced time values for each trial/animal
-    trial_time = np.around(np.linspace(win_start, win_end, len(df.query('Animal == @df.Animal[0] and Trial == @df.Trial[0]'))), 1)
-    df['trial_time'] = np.tile(trial_time, n_trials*n_subjects)
-
-    return df
\ No newline at end of file
+    with fc_profile.stage('tfc_trials_df.trial_windowing', rows_in=len(df)) as st:
+        # subset trial data (-20 prior to CS --> 40s after trace/shock)
+        for tone in trials_idx:
+            start = comp_labs.loc[tone,'start'] + win_start
+            end = comp_labs.loc[tone,'start'] + win_end
+            df.loc[(start <= df.Component) & (df.Component <= end), 'Trial'] = int(trial_no)
+            trial_no += 1
+        #drop time rows outside of (win_start,win_end) trial window    
+        df = df.dropna(subset=['Trial']).reset_index(drop=True)
+        df['Trial'] = df['Trial'].astype(int)
+        st.rows_out = len(df)
+    # time of each bin relative to the tone onset of its trial
+    with fc_profile.stage('tfc_trials_df.trial_time', rows_in=len(df)):
+        tone_starts = comp_labs.loc[trials_idx, 'start'].to_numpy(dtype='float64')
+        df['trial_time'] = np.around(df['Component'].to_numpy(dtype='float64') - tone_starts[df['Trial'] - 1], 2)
+
+    return df
+
+###################################################################################################
+
+def tfc_trials_array(config_path, session='train', win_start=-20, win_end=60, yvar='PctFreeze',
+                     method='nearest'):
+    """
+    Trial data as a dense animal x trial x time array.
+    
+    Every trial window is a grid of `trial_time` points (spaced by the session's median bin
+    size) after its tone onset, and each animal's values are read at those times from its
+    own bin times with `resample_bins`, so no rows are masked and dropped. Points outside an
+    animal's recording (windows past the end of the session, or animals with fewer
+    components) are NaN.
+    
+    Parameters
+    ----------
+    config_path : path to the project yaml file.
+    session : the session used to label.
+    win_start : start of window for each trial (Note: tone onset is t=0)
+    win_end : end of window for each trial (Note: tone onset is t=0)
+    yvar : column to use for values (e.g., 'PctFreeze' or 'AvgMotion').
+    method : 'nearest' (bin closest to each point, within half a bin), 'mean' or 'linear'
+        (see `resample_bins`).
+    
+    Returns
+    -------
+    data : float32 ndarray of shape (n_animals, n_trials, n_timepoints).
+    coords : dict of coordinate arrays for each axis ('Animal', 'Trial', 'trial_time').
+    """
+    df, comp_labs = _label_session(config_path, session)
+    tone_starts = comp_labs.loc[comp_labs['phase'].str.contains('tone'), 'start'].to_numpy(dtype='float64')
+    animal_codes, animals = pd.factorize(df['Animal'])
+    bin_no = df.groupby('Animal', sort=False).cumcount().to_numpy()
+    # per-animal bin times and values, padded with NaN
+    times = np.full((len(animals), bin_no.max() + 1), np.nan)
+    times[animal_codes, bin_no] = df['Component'].to_numpy(dtype='float64')
+    series = np.full(times.shape, np.nan)
+    series[animal_codes, bin_no] = df[yvar].to_numpy(dtype='float64')
+    dt = float(np.nanmedian(np.diff(times, axis=1)))
+    n_timepoints = int(np.floor((win_end - win_start) / dt + 1e-6)) + 1
+    trial_time = win_start + np.arange(n_timepoints) * dt
+    points = (tone_starts[:, None] + trial_time).ravel()
+    data = resample_bins(times, series, points, method=method, width=dt).astype('float32')
+    coords = {'Animal': np.asarray(animals),
+              'Trial': np.arange(1, len(tone_starts) + 1),
+              'trial_time': np.around(trial_time, 2)}
+
+    return data.reshape(len(animals), len(tone_starts), n_timepoints), coords
+
+
+###################################################################################################
+
+RESAMPLE_METHODS = ['nearest', 'mean', 'linear']
+
+
+def resample_bins(times, values, points, method='nearest', width=None):
+    """
+    Resample every animal's series onto the same time points at once.
+    
+    The series of all animals are offset into one sorted array so each point is located
+    with a single `searchsorted` call, whatever the number of animals or their bin sizes.
+    
+    Parameters
+    ----------
+    times : (n_animals, n_bins) array of bin times (sec), increasing along each row and
+        padded with NaN at the end for animals with fewer bins.
+    values : (n_animals, n_bins) array of values for each bin.
+    points : 1-d array of times to resample to.
+    method : 'nearest' (closest bin), 'mean' (average of bins within `width` / 2 of each
+        point) or 'linear' (interpolate between neighbouring bins).
+    width : bin width for 'mean' (default: spacing of `points`).
+    
+    Returns
+    -------
+    resampled : float64 ndarray of shape (n_animals, n_points). Points outside an animal's
+        recording (by more than half its bin size for 'nearest') are NaN.
+    """
+    if method not in RESAMPLE_METHODS:
+        raise ValueError(f'`method` must be one of {RESAMPLE_METHODS}')
+    times = np.atleast_2d(np.asarray(times, dtype='float64'))
+    values = np.atleast_2d(np.asarray(values, dtype='float64'))
+    points = np.asarray(points, dtype='float64')
+    n_animals, n_bins = times.shape
+    n_valid = (~np.isnan(times)).sum(axis=1)
+    if method == 'mean' and width is None:
+        width = np.median(np.diff(np.unique(points))) if len(points) > 1 else 0
+    pad = width / 2 if method == 'mean' else 0
+    # offset each row past the previous one: keys stay sorted across the flattened array
+    lo = min(np.nanmin(times), points.min() - pad)
+    span = max(np.nanmax(times), points.max() + pad) - lo
+    row_off = np.arange(n_animals)[:, None] * (2 * span + 1)
+    keys = (np.where(np.isnan(times), 1.5 * span, times - lo) + row_off).ravel()
+    row_start = np.arange(n_animals)[:, None] * n_bins
+    row_last = row_start + np.maximum(n_valid, 1)[:, None] - 1
+    query = points - lo + row_off
+    if method == 'mean':
+        # NaN-aware sums between the window edges from cumulative sums
+        ok = ~np.isnan(values.ravel())
+        csum = np.concatenate([[0], np.cumsum(np.where(ok, values.ravel(), 0))])
+        ccount = np.concatenate([[0], np.cumsum(ok)])
+        first = np.searchsorted(keys, query - pad, side='left')
+        end = np.minimum(np.searchsorted(keys, query + pad, side='left'), row_last + 1)
+        first = np.minimum(first, end)
+        count = ccount[end] - ccount[first]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(count > 0, (csum[end] - csum[first]) / count, np.nan)
+    right = np.clip(np.searchsorted(keys, query, side='left'), row_start, row_last)
+    left = np.clip(right - 1, row_start, row_last)
+    flat_times, flat_values = times.ravel(), values.ravel()
+    t_left, t_right = flat_times[left], flat_times[right]
+    if method == 'nearest':
+        nearest = np.where(np.abs(points - t_left) <= np.abs(t_right - points), left, right)
+        with np.errstate(all='ignore'):
+            half_bin = np.nanmedian(np.diff(times, axis=1), axis=1)[:, None] / 2
+        half_bin = np.nan_to_num(half_bin)
+        first_t = times[:, :1]
+        last_t = np.take_along_axis(times, np.maximum(n_valid, 1)[:, None] - 1, axis=1)
+        inside = (points >= first_t - half_bin - 1e-9) & (points <= last_t + half_bin + 1e-9)
+        return np.where(inside & (n_valid[:, None] > 0), flat_values[nearest], np.nan)
+    # linear: no extrapolation past the first/last bin
+    with np.errstate(invalid='ignore', divide='ignore'):
+        frac = np.where(t_right > t_left, (points - t_left) / (t_right - t_left), 0.0)
+    inside = (points >= t_left - 1e-9) & (points <= t_right + 1e-9)
+    return np.where(inside, flat_values[left] + frac * (flat_values[right] - flat_values[left]), np.nan)
+
+
+def resample_trials(config_path, session='train', grid=None, win_start=-20, win_end=60, step=None,
+                    method='nearest', yvars=('PctFreeze', 'AvgMotion')):
+    """
+    Trial data on a common time grid, for averaging across exports with different bin sizes.
+    
+    Like `tfc_trials_df`, but 'trial_time' is a fixed grid relative to each tone onset and
+    values are resampled from each animal's bin times (see `resample_bins`) instead of
+    assuming equally spaced bins, so sessions recorded with different bin widths or
+    lengths line up.
+    
+    Parameters
+    ----------
+    config_path : path to the project yaml file.
+    session : the session used to label.
+    grid : times relative to tone onset (sec). Use the same grid for every cohort to combine them.
+    win_start, win_end : window for each trial if `grid` is not given (Note: tone onset is t=0).
+    step : grid spacing if `grid` is not given (default: the session's bin size).
+    method : 'nearest', 'mean' (bin-average) or 'linear'.
+    yvars : columns to resample.
+    
+    Returns
+    -------
+    df : pandas DataFrame with the animal info, 'Trial', 'trial_time' and `yvars` for every
+        point of the grid (NaN outside the recording).
+    """
+    df, comp_labs = _label_session(config_path, session)
+    tone_starts = comp_labs.loc[comp_labs['phase'].str.contains('tone'), 'start'].to_numpy(dtype='float64')
+    animal_codes, animals = pd.factorize(df['Animal'])
+    bin_no = df.groupby('Animal', sort=False).cumcount().to_numpy()
+    times = np.full((len(animals), bin_no.max() + 1), np.nan)
+    times[animal_codes, bin_no] = df['Component'].to_numpy(dtype='float64')
+    if grid is None:
+        if step is None:
+            step = float(np.nanmedian(np.diff(times, axis=1)))
+        grid = np.around(np.arange(win_start, win_end + step / 2, step), 6)
+    grid = np.asarray(grid, dtype='float64')
+    # the grid of every trial, flattened trial-major
+    points = (tone_starts[:, None] + grid).ravel()
+    width = np.median(np.diff(grid)) if len(grid) > 1 else None
+    ids = [col for col in clean_columns(load_expt_config(config_path)) if col not in
+           ['Phase', 'Component', 'PctFreeze', 'AvgMotion']]
+    n_points = len(tone_starts) * len(grid)
+    # animal info in `animals` order (first appearance)
+    out = (df.drop_duplicates('Animal').reindex(columns=ids).reset_index(drop=True)
+           .loc[np.repeat(np.arange(len(animals)), n_points)].reset_index(drop=True))
+    out['Trial'] = np.tile(np.repeat(np.arange(1, len(tone_starts) + 1), len(grid)), len(animals))
+    out['trial_time'] = np.tile(grid, len(tone_starts) * len(animals))
+    for yvar in yvars:
+        values = np.full(times.shape, np.nan)
+        values[animal_codes, bin_no] = df[yvar].to_numpy(dtype='float64')
+        out[yvar] = resample_bins(times, values, points, method=method, width=width).ravel()
+
+    return out
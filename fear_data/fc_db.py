@@ -0,0 +1,230 @@
+"""
+Local SQLite store of cleaned sessions for queries across cohorts.
+
+    fc_db.ingest('fear_data.db', config_paths)
+    fc_db.query('fear_data.db', sessions='tone', sexes='M', groups='Group A',
+                since='2020-01-01', by=['Cohort', 'Phase'])
+
+`ingest` stores the output of `clean_data` for every session (one row per animal and
+component) with the animal info from each config. Sessions already stored from an
+unchanged raw file and config are skipped. Queries filter and aggregate in SQL, so the
+raw VideoFreeze files are not read again.
+"""
+import json
+import sqlite3
+from contextlib import closing
+import numpy as np
+import pandas as pd
+from .fc_dat import load_expt_config, session_file, read_header, clean_data, animal_metadata
+from .fc_cache import file_hash, config_hash
+from .fc_batch import cohort_name
+
+BIN_COLS = ['Cohort', 'Session', 'Animal', 'Group', 'Sex', 'Phase', 'Component', 'Bin', 'PctFreeze', 'AvgMotion']
+# query filter argument -> column
+FILTERS = {'cohorts': 'Cohort', 'sessions': 'Session', 'animals': 'Animal', 'groups': 'Group',
+           'sexes': 'Sex', 'phases': 'Phase', 'components': 'Component'}
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    Cohort TEXT, Session TEXT, Date TEXT, config_path TEXT, raw_file TEXT,
+    file_hash TEXT, config_hash TEXT, n_rows INTEGER,
+    PRIMARY KEY (Cohort, Session));
+CREATE TABLE IF NOT EXISTS animals (
+    Cohort TEXT, Animal TEXT, "Group" TEXT, Sex TEXT, factors TEXT,
+    PRIMARY KEY (Cohort, Animal));
+CREATE TABLE IF NOT EXISTS bins (
+    Cohort TEXT, Session TEXT, Animal TEXT, "Group" TEXT, Sex TEXT, Phase TEXT,
+    Component TEXT, Bin INTEGER, PctFreeze REAL, AvgMotion REAL);
+CREATE INDEX IF NOT EXISTS ix_bins_cohort ON bins (Cohort, Session, Animal);
+CREATE INDEX IF NOT EXISTS ix_bins_session ON bins (Session, Phase, Component);
+CREATE INDEX IF NOT EXISTS ix_bins_animal ON bins (Animal);
+CREATE INDEX IF NOT EXISTS ix_bins_group ON bins ("Group", Sex);
+CREATE INDEX IF NOT EXISTS ix_bins_sex ON bins (Sex);
+"""
+
+
+###################################################################################################
+###################################################################################################
+
+def connect(db_path):
+    """Open (and create if needed) the database at `db_path`."""
+    con = sqlite3.connect(db_path)
+    con.executescript(SCHEMA)
+
+    return con
+
+
+def _session_date(file):
+    """Recording date from the file header as 'YYYY-MM-DD HH:MM:SS' (None if missing)."""
+    date = read_header(file)['date']
+    try:
+        return pd.to_datetime(date).strftime('%Y-%m-%d %H:%M:%S')
+    except (TypeError, ValueError):
+        return None
+
+
+def ingest(db_path, config_paths, sessions=None, force=False):
+    """
+    Store cleaned sessions and animal info from each config in the database.
+
+    Parameters
+    ----------
+    db_path : path to the SQLite database.
+    config_paths : list of paths to project yaml files.
+    sessions : sessions to store from each config (default: all sessions in the config).
+    force : if True, re-ingest sessions even if the raw file and config are unchanged.
+
+    Returns
+    -------
+    report : pandas DataFrame with the 'Cohort', 'Session', number of 'rows' stored and
+        'status' ('ingested', 'skipped' or the error) of each session.
+
+    Notes
+    -----
+    Cohorts are identified by `fc_batch.cohort_name` (the config's 'Experiment'), so configs
+    with the same name replace each other's sessions.
+    """
+    report = []
+    with closing(connect(db_path)) as con:
+        for config_path in config_paths:
+            expt_info = load_expt_config(config_path)
+            cohort = cohort_name(config_path)
+            cfg_hash = config_hash(expt_info)
+            meta = animal_metadata(expt_info)
+            for session in (sessions if sessions is not None else expt_info['sessions']):
+                try:
+                    file = session_file(expt_info, session)
+                    raw_hash = file_hash(file)
+                    prev = con.execute('SELECT file_hash, config_hash, n_rows FROM sessions '
+                                       'WHERE Cohort = ? AND Session = ?', (cohort, session)).fetchone()
+                    if not force and prev is not None and prev[:2] == (raw_hash, cfg_hash):
+                        report.append((cohort, session, prev[2], 'skipped'))
+                        continue
+                    df = clean_data(config_path, session, meta=meta)
+                    with con:
+                        _write_session(con, cohort, session, df, meta)
+                        con.execute('INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                    (cohort, session, _session_date(file), config_path, file,
+                                     raw_hash, cfg_hash, len(df)))
+                    report.append((cohort, session, len(df), 'ingested'))
+                except Exception as err:
+                    report.append((cohort, session, 0, repr(err)))
+
+    return pd.DataFrame(report, columns=['Cohort', 'Session', 'rows', 'status'])
+
+
+def _write_session(con, cohort, session, df, meta):
+    """Replace the rows of one session and the cohort's animal info."""
+    rows = df.assign(Cohort=cohort, Session=session,
+                     Component=df['Component'].astype(str),
+                     Bin=df.groupby('Animal', sort=False).cumcount()).reindex(columns=BIN_COLS)
+    rows = rows.astype(object).where(rows.notna(), None)
+    con.execute('DELETE FROM bins WHERE Cohort = ? AND Session = ?', (cohort, session))
+    con.executemany(f'INSERT INTO bins VALUES ({", ".join("?" * len(BIN_COLS))})',
+                    rows.itertuples(index=False, name=None))
+    # Group in the data includes the file's Group for animals not in the config
+    first = df.drop_duplicates('Animal').set_index('Animal')
+    animals = meta.reindex(first.index)
+    animals['Group'] = first['Group']
+    factors = [col for col in animals.columns if col not in ['Group', 'Sex']]
+    con.executemany('INSERT OR REPLACE INTO animals VALUES (?, ?, ?, ?, ?)',
+                    [(cohort, animal, _none(row.get('Group')), _none(row.get('Sex')),
+                      json.dumps({col: _none(row[col]) for col in factors}))
+                     for animal, row in animals.iterrows()])
+
+
+def _none(val):
+    return None if pd.isna(val) else val
+
+
+###################################################################################################
+
+def _where(filters, since=None, until=None):
+    """SQL WHERE clause and parameters for the query filters."""
+    clauses, params = [], []
+    for arg, col in FILTERS.items():
+        vals = filters.get(arg)
+        if vals is None:
+            continue
+        vals = [vals] if isinstance(vals, (str, int)) else list(vals)
+        clauses.append(f'b."{col}" IN ({", ".join("?" * len(vals))})')
+        params += [str(val) for val in vals]
+    for val, op in [(since, '>='), (until, '<=')]:
+        if val is not None:
+            clauses.append(f's.Date {op} ?')
+            params.append(pd.to_datetime(val).strftime('%Y-%m-%d %H:%M:%S'))
+
+    return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+
+def query(db_path, by=None, yvar='PctFreeze', since=None, until=None, per_animal=True, **filters):
+    """
+    Select (and optionally aggregate) stored bins.
+
+    Parameters
+    ----------
+    db_path : path to the SQLite database.
+    by : (optional) list of columns to group by (e.g., ['Cohort', 'Group', 'Phase']).
+        Without `by`, the matching rows are returned.
+    yvar : column to aggregate ('PctFreeze' or 'AvgMotion').
+    since, until : only include sessions recorded on/after `since` or on/before `until`
+        (dates from the VideoFreeze file header).
+    per_animal : if True, average each animal first so every animal counts once in each group.
+    **filters : cohorts, sessions, animals, groups, sexes, phases, components: value or list
+        of values to keep.
+
+    Returns
+    -------
+    df : pandas DataFrame of the matching rows, or with `by` columns and the 'mean', 'sem'
+        and 'n' of `yvar` for each group.
+    """
+    unknown = set(filters) - set(FILTERS)
+    if unknown:
+        raise ValueError(f'unknown filters {sorted(unknown)} - use {list(FILTERS)}')
+    if yvar not in ['PctFreeze', 'AvgMotion']:
+        raise ValueError("`yvar` must be 'PctFreeze' or 'AvgMotion'")
+    if by is not None:
+        by = [by] if isinstance(by, str) else list(by)
+        unknown = [col for col in by if col not in BIN_COLS]
+        if unknown:
+            raise ValueError(f'unknown `by` columns {unknown} - use {BIN_COLS}')
+    where, params = _where(filters, since, until)
+    source = 'bins b JOIN sessions s ON b.Cohort = s.Cohort AND b.Session = s.Session'
+    if by is None:
+        cols = ', '.join(f'b."{col}"' for col in BIN_COLS)
+        sql = f'SELECT {cols} FROM {source}{where} ORDER BY b.Cohort, b.Session, b.rowid'
+    else:
+        if per_animal:
+            inner = ', '.join(f'b."{col}"' for col in dict.fromkeys(list(by) + ['Cohort', 'Animal']))
+            source = f'(SELECT {inner}, AVG(b."{yvar}") AS "{yvar}" FROM {source}{where} GROUP BY {inner}) b'
+            where = ''
+        group = ', '.join(f'b."{col}"' for col in by)
+        sql = (f'SELECT {group}, AVG(b."{yvar}") AS mean, AVG(b."{yvar}" * b."{yvar}") AS mean_sq, '
+               f'COUNT(b."{yvar}") AS n FROM {source}{where} GROUP BY {group} ORDER BY {group}')
+    with closing(connect(db_path)) as con:
+        df = pd.read_sql_query(sql, con, params=params)
+    if by is not None:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            var = (df['mean_sq'] - df['mean'] ** 2) * df['n'] / (df['n'] - 1)
+            df['sem'] = np.sqrt(np.maximum(var, 0) / df['n'])
+        df = df[list(by) + ['mean', 'sem', 'n']]
+
+    return df
+
+
+def list_sessions(db_path):
+    """Sessions stored in the database (one row per cohort/session)."""
+    with closing(connect(db_path)) as con:
+        return pd.read_sql_query('SELECT * FROM sessions ORDER BY Cohort, Session', con)
+
+
+def list_animals(db_path, cohorts=None):
+    """Animal info stored for each cohort, with factors expanded into columns."""
+    where, params = '', []
+    if cohorts is not None:
+        cohorts = [cohorts] if isinstance(cohorts, str) else list(cohorts)
+        where, params = f' WHERE Cohort IN ({", ".join("?" * len(cohorts))})', cohorts
+    with closing(connect(db_path)) as con:
+        df = pd.read_sql_query(f'SELECT * FROM animals{where} ORDER BY Cohort, Animal', con, params=params)
+    factors = pd.DataFrame([json.loads(val) for val in df.pop('factors')], index=df.index)
+
+    return pd.concat([df, factors], axis=1)
@@ -0,0 +1,109 @@
+"""
+Bulk wide-format (Prism) export of loaded sessions.
+
+    data = {'train': clean_data(config_path, 'train'),
+            'tone': clean_data(config_path, 'tone'),
+            'train_trials': tfc_trials_df(config_path, 'train')}
+    tables = prism_tables(data, cols={'train_trials': ['Trial']})
+    write_prism(tables, 'prism_tables.xlsx')
+
+Each table matches `clean_data(..., prism_format=True, prism_col=col)`: one row per animal
+(sorted by 'Group') and one column per `col` value, in order of first appearance. The
+animal and group codes of a session are computed once and shared by all of its tables.
+"""
+import os
+from os.path import join, splitext
+import numpy as np
+import pandas as pd
+
+PRISM_COLS = ['Component', 'Phase', 'Trial']
+
+
+###################################################################################################
+###################################################################################################
+
+def prism_tables(data, cols=PRISM_COLS, yvar='PctFreeze'):
+    """
+    Wide tables of mean `yvar` per animal for each session and column.
+
+    Parameters
+    ----------
+    data : dict of session name -> DataFrame (from `clean_data`, `tfc_trials_df`, ...),
+        or an `fc_batch.Experiment`.
+    cols : columns to spread into tables (those missing from a session are skipped), or a
+        dict of session name -> columns.
+    yvar : column to average (e.g., 'PctFreeze' or 'AvgMotion').
+
+    Returns
+    -------
+    tables : dict of (session, col) -> wide DataFrame with 'Animal', 'Group' and one column
+        per `col` value.
+    """
+    sessions = data.sessions if hasattr(data, 'sessions') else data
+    tables = {}
+    for session, df in sessions.items():
+        session_cols = cols.get(session, PRISM_COLS) if isinstance(cols, dict) else cols
+        session_cols = [col for col in session_cols if col in df]
+        if not session_cols:
+            continue
+        # animals without a group are dropped, as in `pivot_table`
+        df = df[df['Group'].notna()]
+        animal_codes, animals = pd.factorize(np.asarray(df['Animal'], dtype=object))
+        groups = np.asarray(df['Group'], dtype=object)[np.unique(animal_codes, return_index=True)[1]]
+        index = pd.MultiIndex.from_arrays([animals, groups], names=['Animal', 'Group'])
+        values = df[yvar].to_numpy(dtype='float64')
+        has_value = ~np.isnan(values)
+        for col in session_cols:
+            tables[(session, col)] = _wide_table(animal_codes, index, df[col], values, has_value)
+
+    return tables
+
+
+def _wide_table(animal_codes, index, labels, values, has_value):
+    """Mean of `values` for each animal (row) and label (column) from integer codes."""
+    col_codes, columns = pd.factorize(labels)
+    keep = has_value & (col_codes >= 0)
+    n_cols = len(columns)
+    cell = animal_codes[keep] * n_cols + col_codes[keep]
+    size = len(index) * n_cols
+    sums = np.bincount(cell, weights=values[keep], minlength=size)
+    counts = np.bincount(cell, minlength=size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(counts > 0, sums / counts, np.nan).reshape(len(index), n_cols)
+    table = pd.DataFrame(means, index=index, columns=pd.Index(np.asarray(columns), name=labels.name))
+
+    return (table
+            .sort_index()
+            .dropna(how='all')
+            .sort_values('Group')
+            .reset_index())
+
+
+def write_prism(tables, out):
+    """
+    Write wide tables to one workbook or a directory of .csv files.
+
+    Parameters
+    ----------
+    tables : dict of (session, col) -> DataFrame from `prism_tables`.
+    out : path of an .xlsx workbook (one sheet per table, named '<session>_<col>'), or a
+        directory for '<session>_<col>.csv' files.
+
+    Returns
+    -------
+    paths : list of the files written.
+    """
+    names = {key: f'{key[0]}_{key[1]}' if isinstance(key, tuple) else str(key) for key in tables}
+    if splitext(out)[1].lower() == '.xlsx':
+        with pd.ExcelWriter(out) as writer:
+            for key, table in tables.items():
+                # Excel limits sheet names to 31 characters
+                table.to_excel(writer, sheet_name=names[key][:31], index=False)
+        return [out]
+    os.makedirs(out, exist_ok=True)
+    paths = []
+    for key, table in tables.items():
+        paths.append(join(out, f'{names[key]}.csv'))
+        table.to_csv(paths[-1], index=False)
+
+    return paths
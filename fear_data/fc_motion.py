@@ -0,0 +1,213 @@
+"""
+Memory-mapped store for frame-level motion data.
+
+A store is two files sharing a name:
+
+    <name>.f32   motion index of every animal as one contiguous float32 array (animal-major)
+    <name>.json  index with the animals, their offsets and number of frames, fps, scoring
+                 parameters and the 'Component Details' schedule of the session
+
+`MotionStore` opens the array with `np.memmap`, so slicing an animal or a trial window
+returns a view and only the pages that are touched are read from disk.
+"""
+import os
+import json
+from os.path import join, splitext
+import numpy as np
+import pandas as pd
+from .fc_dat import load_expt_config, session_file, read_header, header_comp_times, COMP_COLS
+
+STORE_DTYPE = 'float32'
+
+
+###################################################################################################
+###################################################################################################
+
+class MotionStore:
+    """
+    Read-only view of a motion store.
+
+    Parameters
+    ----------
+    path : path to the store (with or without the .json/.f32 extension).
+
+    Attributes
+    ----------
+    animals : list of animal ids.
+    fps : video frame rate.
+    components : pandas DataFrame of the session schedule (see `fc_dat.scan_header`).
+    motion_threshold, min_freeze_duration : scoring parameters from the VideoFreeze header.
+    """
+
+    def __init__(self, path):
+        base = splitext(path)[0] if splitext(path)[1] in ['.json', '.f32'] else path
+        with open(base + '.json') as f:
+            index = json.load(f)
+        self.animals = index['animals']
+        self.offsets = np.asarray(index['offsets'], dtype='int64')
+        self.n_frames = np.asarray(index['n_frames'], dtype='int64')
+        self.fps = index['fps']
+        self.motion_threshold = index.get('motion_threshold')
+        self.min_freeze_duration = index.get('min_freeze_duration')
+        self.components = pd.DataFrame(index['components'], columns=COMP_COLS + ['end'])
+        self.data = np.memmap(base + '.f32', dtype=STORE_DTYPE, mode='r', shape=(int(self.n_frames.sum()),))
+        self._pos = {animal: i for i, animal in enumerate(self.animals)}
+
+    def __len__(self):
+        return len(self.animals)
+
+    def __repr__(self):
+        return f'MotionStore({len(self.animals)} animals, {int(self.n_frames.max(initial=0))} frames, {self.fps} fps)'
+
+    def animal(self, animal):
+        """Motion trace of one animal (a view into the memory map)."""
+        i = self._pos[str(animal)]
+        return self.data[self.offsets[i]:self.offsets[i] + self.n_frames[i]]
+
+    @property
+    def motion(self):
+        """(n_animals, n_frames) view of every trace. Requires all animals to have the same length."""
+        if len(set(self.n_frames.tolist())) > 1:
+            raise ValueError('animals have different numbers of frames - use `animal` instead')
+        return self.data.reshape(len(self.animals), -1)
+
+    def window(self, start, end, animal=None):
+        """
+        Frames between `start` and `end` sec (a view into the memory map).
+
+        Returns
+        -------
+        motion : array of shape (n_animals, n_window_frames), or (n_window_frames,) if `animal`
+            is given. Windows are clipped to the recorded frames.
+        """
+        first, last = int(round(start * self.fps)), int(round(end * self.fps))
+        if animal is not None:
+            trace = self.animal(animal)
+            return trace[max(first, 0):max(last, 0)]
+        return self.motion[:, max(first, 0):max(last, 0)]
+
+    def trial_starts(self):
+        """Tone onset (sec) of each trial, from the session schedule."""
+        phases = header_comp_times(self.components)
+        return phases.loc[phases['phase'].str.startswith('tone'), 'start'].to_numpy()
+
+    def trial(self, trial, win_start=-20, win_end=60, animal=None):
+        """
+        Frames from `win_start` to `win_end` sec around the tone onset of `trial` (1-based),
+        as a view into the memory map (see `window`).
+        """
+        onset = self.trial_starts()[trial - 1]
+        return self.window(onset + win_start, onset + win_end, animal)
+
+
+###################################################################################################
+
+def write_store(path, motion, animals, components, fps=30, motion_threshold=None, min_freeze_duration=None):
+    """
+    Write motion traces to a store.
+
+    Parameters
+    ----------
+    path : path of the store (without extension).
+    motion : array of shape (n_animals, n_frames), or a list of 1-d traces (one per animal).
+    animals : animal ids for each trace.
+    components : session schedule (see `fc_dat.scan_header`).
+    fps : video frame rate.
+    motion_threshold, min_freeze_duration : scoring parameters to keep with the data.
+
+    Returns
+    -------
+    store : MotionStore opened on the written files.
+    """
+    traces = [np.asarray(trace, dtype=STORE_DTYPE) for trace in motion]
+    n_frames = [len(trace) for trace in traces]
+    with open(path + '.f32', 'wb') as f:
+        for trace in traces:
+            trace.tofile(f)
+    _write_index(path, animals, n_frames, components, fps, motion_threshold, min_freeze_duration)
+
+    return MotionStore(path)
+
+
+def _write_index(path, animals, n_frames, components, fps, motion_threshold, min_freeze_duration):
+    comps = components.reindex(columns=COMP_COLS + ['end']).astype({'Component': str})
+    index = {'animals': [str(animal) for animal in animals],
+             'offsets': np.concatenate([[0], np.cumsum(n_frames)[:-1]]).astype(int).tolist(),
+             'n_frames': [int(n) for n in n_frames],
+             'fps': fps,
+             'motion_threshold': motion_threshold,
+             'min_freeze_duration': min_freeze_duration,
+             'components': json.loads(comps.to_json(orient='values'))}
+    with open(path + '.json', 'w') as f:
+        json.dump(index, f, indent=1)
+
+
+def convert_motion_csv(motion_file, out_path, vf_file=None, fps=None, chunksize=100000):
+    """
+    Convert a motion trace .csv (one column per animal, see `fc_score.read_motion_csv`) to a store.
+
+    The .csv is read `chunksize` frames at a time and written into the memory-mapped output,
+    so the whole session is never held in memory.
+
+    Parameters
+    ----------
+    motion_file : path to the motion .csv.
+    out_path : path of the store (without extension).
+    vf_file : (optional) VideoFreeze export of the session; its header provides the
+        schedule and scoring parameters.
+    fps : video frame rate (default: from the schedule in `vf_file`, otherwise 30).
+    chunksize : number of frames read at a time.
+
+    Returns
+    -------
+    store : MotionStore opened on the written files.
+    """
+    # blank lines are skipped by `read_csv`, so they are not frames
+    with open(motion_file, 'rb') as f:
+        n_frames = sum(1 for line in f if line.strip()) - 1
+    animals = list(pd.read_csv(motion_file, nrows=0).columns)
+    out = np.memmap(out_path + '.f32', dtype=STORE_DTYPE, mode='w+', shape=(len(animals), n_frames))
+    start = 0
+    for chunk in pd.read_csv(motion_file, engine='c', dtype=STORE_DTYPE, chunksize=chunksize):
+        out[:, start:start + len(chunk)] = chunk.to_numpy().T
+        start += len(chunk)
+    if start != n_frames:
+        raise ValueError(f'{motion_file}: read {start} frames, expected {n_frames}')
+    out.flush()
+    del out
+    header = read_header(vf_file) if vf_file is not None else {}
+    components = header.get('components', pd.DataFrame(columns=COMP_COLS + ['end']))
+    if fps is None:
+        fps = float(np.median(components['duration_frames'] / components['duration'])) if len(components) else 30
+    _write_index(out_path, animals, [n_frames] * len(animals), components, fps,
+                 header.get('motion_threshold'), header.get('min_freeze_duration'))
+
+    return MotionStore(out_path)
+
+
+def convert_session(config_path, session, out_path=None, fps=None):
+    """
+    Convert the `<session>_motion_file` of a session to a store.
+
+    Parameters
+    ----------
+    config_path : path to the project yaml file.
+    session : the session to convert.
+    out_path : path of the store (default: `<session>_motion` in `proc_data_path`).
+    fps : video frame rate (default: from the session schedule).
+
+    Returns
+    -------
+    store : MotionStore opened on the written files.
+    """
+    expt_info = load_expt_config(config_path)
+    file = session_file(expt_info, session)
+    key = f'{session.lower()}_motion_file'
+    if key not in expt_info:
+        raise ValueError(f'`{key}` not found in expt_config.yaml')
+    data_path = expt_info['raw_data_path'] if expt_info['raw_data'] else expt_info['proc_data_path']
+    if out_path is None:
+        os.makedirs(expt_info['proc_data_path'], exist_ok=True)
+        out_path = join(expt_info['proc_data_path'], f'{session.lower()}_motion')
+
+    return convert_motion_csv(join(data_path, expt_info[key]), out_path, vf_file=file, fps=fps)
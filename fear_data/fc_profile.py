@@ -0,0 +1,188 @@
+"""
+Opt-in profiling of the stages in the fc_dat pipeline.
+
+Enable with the `profile` context manager:
+
+    with fc_profile.profile() as report:
+        fc_dat.tfc_trials_df(config_path, 'train')
+    report.to_frame()
+
+or for a whole process by setting the environment variable FEAR_DATA_PROFILE=1
+(optionally with FEAR_DATA_PROFILE_OUT=report.json to write the report at exit).
+When disabled, `stage` returns a shared no-op context manager.
+"""
+import os
+import json
+import time
+import atexit
+import threading
+import tracemalloc
+from contextlib import contextmanager
+import pandas as pd
+
+REPORT_COLS = ['stage', 'wall_s', 'rows_in', 'rows_out', 'peak_mb']
+
+
+###################################################################################################
+###################################################################################################
+
+class ProfileReport:
+    """Stage records collected while profiling is enabled."""
+
+    def __init__(self):
+        self.records = []
+
+    def to_frame(self):
+        """Return the records as a pandas DataFrame (one row per stage call)."""
+        return pd.DataFrame(self.records, columns=REPORT_COLS)
+
+    def summary(self):
+        """Total wall time, number of calls and max peak memory for each stage."""
+        return (self.to_frame()
+                .groupby('stage', sort=False)
+                .agg(calls=('wall_s', 'size'), wall_s=('wall_s', 'sum'), peak_mb=('peak_mb', 'max'))
+                .reset_index())
+
+    def to_json(self, path=None):
+        """Return the records as a JSON string, or write them to `path`."""
+        out = json.dumps(self.records, indent=1)
+        if path is None:
+            return out
+        with open(path, 'w') as f:
+            f.write(out)
+
+
+class _Stage:
+    """
+    Time one stage and record it in `report`.
+
+    Stages may nest: tracemalloc has a single peak counter, so before an inner stage resets
+    it the peak so far is saved on the enclosing stage, and the inner stage's peak is carried
+    up to the enclosing stage when it exits.
+    """
+
+    def __init__(self, report, name, rows_in):
+        self.report = report
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self._peak = 0
+
+    def __enter__(self):
+        stack = _active_stages()
+        if tracemalloc.is_tracing():
+            if stack:
+                stack[-1]._peak = max(stack[-1]._peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            self._mem0 = tracemalloc.get_traced_memory()[0]
+        stack.append(self)
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self._t0
+        stack = _active_stages()
+        if stack and stack[-1] is self:
+            stack.pop()
+        peak = None
+        if tracemalloc.is_tracing():
+            self._peak = max(self._peak, tracemalloc.get_traced_memory()[1])
+            peak = (self._peak - self._mem0) / 1e6
+            if stack:
+                stack[-1]._peak = max(stack[-1]._peak, self._peak)
+        self.report.records.append({'stage': self.name, 'wall_s': wall, 'rows_in': self.rows_in,
+                                    'rows_out': self.rows_out, 'peak_mb': peak})
+        return False
+
+
+def _active_stages():
+    """Stack of stages entered (and not exited) in the current thread."""
+    if not hasattr(_local, 'stages'):
+        _local.stages = []
+    return _local.stages
+
+
+class _NullStage:
+    """No-op stage used when profiling is disabled."""
+    rows_out = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+_local = threading.local()
+_report = None
+
+
+###################################################################################################
+
+def stage(name, rows_in=None):
+    """
+    Context manager timing one pipeline stage. Set `rows_out` on the returned object.
+
+    Parameters
+    ----------
+    name : stage name (e.g. 'load_data.csv_parse').
+    rows_in : number of rows going into the stage.
+    """
+    if _report is None:
+        return _NULL_STAGE
+    return _Stage(_report, name, rows_in)
+
+
+def enabled():
+    """True if stages are currently being recorded."""
+    return _report is not None
+
+
+def get_report():
+    """The report stages are currently recorded to (None if profiling is disabled)."""
+    return _report
+
+
+@contextmanager
+def profile(trace_memory=True):
+    """
+    Record every pipeline stage run inside the block.
+
+    Parameters
+    ----------
+    trace_memory : if True, record peak memory of each stage with tracemalloc.
+
+    Yields
+    ------
+    report : ProfileReport
+    """
+    global _report
+    prev_report = _report
+    _report = ProfileReport()
+    started = trace_memory and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        yield _report
+    finally:
+        if started:
+            tracemalloc.stop()
+        _report = prev_report
+
+
+def _enable_from_env():
+    global _report
+    if os.environ.get('FEAR_DATA_PROFILE', '') in ['', '0']:
+        return
+    _report = ProfileReport()
+    tracemalloc.start()
+    out = os.environ.get('FEAR_DATA_PROFILE_OUT')
+    if out:
+        atexit.register(_report.to_json, out)
+
+
+_enable_from_env()
@@ -0,0 +1,120 @@
+"""
+Render many figures without a display, in parallel.
+
+Each figure is described by a spec dict:
+
+    {'plot': 'bins' or 'phase',      # plot_fc_bins or plot_fc_phase
+     'config_path': path to the project yaml file,
+     'session': session to plot,
+     'name': (optional) output file name without extension,
+     'data': (optional) DataFrame from `clean_data` to plot instead of loading the session,
+     'kwargs': (optional) dict of keyword arguments for the plot function}
+"""
+import os
+import re
+from os.path import join
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+
+PLOT_FUNCS = {'bins': 'plot_fc_bins', 'phase': 'plot_fc_phase'}
+FIG_SIZES = {'bins': (16, 10), 'phase': (16, 9)}
+
+
+###################################################################################################
+###################################################################################################
+
+def figure_name(spec):
+    """Deterministic file name (without extension) for a figure spec."""
+    if spec.get('name'):
+        return spec['name']
+    from .fc_batch import cohort_name
+    kwargs = spec.get('kwargs') or {}
+    parts = [cohort_name(spec['config_path']), spec['session'], spec['plot']]
+    parts += [f'{key}-{kwargs[key]}' for key in ['hue', 'kind', 'xvar', 'yvar'] if key in kwargs]
+
+    return re.sub(r'[^\w.-]+', '_', '_'.join(str(part) for part in parts))
+
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def _render_group(specs, out_dir, fmts, dpi):
+    """Render (index, spec) pairs that share a config/session, loading the data at most once."""
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from . import fc_viz
+    from .fc_dat import clean_data
+    results = []
+    loaded = None
+    for idx, spec in specs:
+        name = figure_name(spec)
+        try:
+            # a spec's own 'data' is only used for that spec; the loaded session is shared
+            df = spec.get('data')
+            if df is None:
+                if loaded is None:
+                    loaded = clean_data(spec['config_path'], spec['session'])
+                df = loaded
+            kwargs = dict(spec.get('kwargs') or {})
+            fig_size = kwargs.pop('fig_size', FIG_SIZES[spec['plot']])
+            # figures outside pyplot: the user's backend and open figures are untouched
+            fig = Figure(figsize=fig_size)
+            FigureCanvasAgg(fig)
+            ax = fig.subplots()
+            plot_func = getattr(fc_viz, PLOT_FUNCS[spec['plot']])
+            if spec['plot'] == 'bins':
+                plot_func(df, spec['session'], ax=ax, **kwargs)
+            else:
+                plot_func(df, ax=ax, **kwargs)
+            paths = [join(out_dir, f'{name}.{fmt}') for fmt in fmts]
+            for path in paths:
+                fig.savefig(path, dpi=dpi)
+            results.append((idx, {'name': name, 'paths': paths, 'error': None}))
+        except Exception as err:
+            results.append((idx, {'name': name, 'paths': [], 'error': repr(err)}))
+
+    return results
+
+
+###################################################################################################
+
+def render_figures(specs, out_dir, fmt='png', n_jobs=None, dpi=None):
+    """
+    Render figures from a list of plot specs with the Agg backend and save them to `out_dir`.
+
+    Specs with the same config/session are rendered by the same worker so the data is only
+    loaded once, and every figure is closed as soon as it is saved.
+
+    Parameters
+    ----------
+    specs : list of dicts describing each figure (see module docstring).
+    out_dir : directory to save figures to.
+    fmt : file format or list of formats (e.g. 'png', 'svg', 'pdf').
+    n_jobs : number of worker processes (default: os.cpu_count()). Use 1 to render in-process.
+    dpi : resolution of saved figures (default: matplotlib's savefig.dpi).
+
+    Returns
+    -------
+    results : pandas DataFrame with the 'name', saved 'paths' and any 'error' for each spec
+        (in the order of `specs`).
+    """
+    fmts = [fmt] if isinstance(fmt, str) else list(fmt)
+    for spec in specs:
+        if spec.get('plot') not in PLOT_FUNCS:
+            raise ValueError(f"spec 'plot' must be one of {list(PLOT_FUNCS)}")
+    os.makedirs(out_dir, exist_ok=True)
+    groups = {}
+    for idx, spec in enumerate(specs):
+        groups.setdefault((spec['config_path'], spec['session']), []).append((idx, spec))
+
+    if n_jobs == 1:
+        results = [_render_group(group, out_dir, fmts, dpi) for group in groups.values()]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs or os.cpu_count(), initializer=_init_worker) as pool:
+            futures = [pool.submit(_render_group, group, out_dir, fmts, dpi) for group in groups.values()]
+            results = [future.result() for future in futures]
+
+    results = sorted(res for group in results for res in group)
+    return pd.DataFrame([res for _, res in results], columns=['name', 'paths', 'error'])
@@ -0,0 +1,321 @@
+"""
+Score freezing from per-frame motion index traces.
+
+Motion traces are stored as a .csv with one column per animal (named by animal id) and
+one row per video frame, starting at frame 0 of the session. Set `<session>_motion_file`
+in expt_config.yaml (relative to the raw/processed data path, like `<session>_file`) to
+score a session with `score_session`.
+
+An animal is freezing while its motion index stays below the motion threshold for at
+least the minimum freeze duration (in frames), the same parameters VideoFreeze records
+in the export header.
+"""
+import os
+from os.path import join
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from . import fc_profile
+from .fc_dat import (load_expt_config, session_file, read_header, animal_metadata, add_metadata,
+                     label_phases, clean_columns)
+
+
+###################################################################################################
+###################################################################################################
+
+def read_motion_csv(file):
+    """
+    Read per-frame motion traces.
+
+    Parameters
+    ----------
+    file : path to a .csv with one column per animal and one row per frame.
+
+    Returns
+    -------
+    motion : float32 ndarray of shape (n_animals, n_frames).
+    animals : list of animal ids (str).
+    """
+    df = pd.read_csv(file, engine='c', dtype='float32')
+
+    return np.ascontiguousarray(df.to_numpy().T), [str(col) for col in df.columns]
+
+
+def write_motion_csv(file, motion, animals):
+    """Write motion traces of shape (n_animals, n_frames) as a .csv with one column per animal."""
+    pd.DataFrame(np.asarray(motion).T, columns=[str(animal) for animal in animals]).to_csv(file, index=False)
+
+    return file
+
+
+###################################################################################################
+
+def freeze_frames(motion, threshold, min_duration):
+    """
+    Mark the frames where each animal is freezing.
+
+    Runs of frames below `threshold` are found for every animal at once from the edges of
+    the below-threshold mask, and only runs of at least `min_duration` frames are kept.
+
+    Parameters
+    ----------
+    motion : array of shape (n_animals, n_frames) (or (n_frames,) for one animal).
+    threshold : motion index below which an animal is considered still.
+    min_duration : minimum number of consecutive still frames scored as freezing.
+
+    Returns
+    -------
+    frozen : bool ndarray with the same shape as `motion`. NaN frames are never freezing.
+    """
+    motion = np.asarray(motion)
+    runs = _still_runs(np.atleast_2d(motion), threshold)
+
+    return _keep_runs(runs, min_duration).reshape(motion.shape)
+
+
+def _still_runs(motion, threshold):
+    """Start and end (exclusive) of each below-threshold run, as flat indices into (n_animals, n_frames + 1)."""
+    n_animals, n_frames = motion.shape
+    # pad with a still-free frame on each side so runs start and end within each row
+    padded = np.zeros((n_animals, n_frames + 2), dtype='int8')
+    padded[:, 1:-1] = motion < threshold
+    edges = np.diff(padded, axis=1).ravel()
+
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1), motion.shape
+
+
+def _keep_runs(runs, min_duration):
+    """Mark the frames of runs from `_still_runs` lasting at least `min_duration` frames."""
+    starts, ends, (n_animals, n_frames) = runs
+    keep = (ends - starts) >= min_duration
+    marks = np.zeros(n_animals * (n_frames + 1), dtype='int8')
+    marks[starts[keep]] = 1
+    marks[ends[keep]] = -1
+
+    return np.cumsum(marks.reshape(n_animals, n_frames + 1), axis=1)[:, :n_frames] > 0
+
+
+def bin_frames(values, components):
+    """
+    Mean of per-frame values over each component.
+
+    Parameters
+    ----------
+    values : array of shape (n_animals, n_frames).
+    components : component schedule with 'start_frame' and 'duration_frames' (see
+        `fc_dat.scan_header` or `fc_synth.make_schedule`). Components may overlap or leave gaps.
+
+    Returns
+    -------
+    binned : float64 ndarray of shape (n_animals, n_components). NaN frames are ignored and
+        components with no recorded frames are NaN.
+    """
+    values = np.atleast_2d(np.asarray(values, dtype='float64'))
+    n_frames = values.shape[1]
+    starts = np.clip(components['start_frame'].to_numpy(dtype='int64'), 0, n_frames)
+    ends = np.clip(starts + components['duration_frames'].to_numpy(dtype='int64'), 0, n_frames)
+    valid = ~np.isnan(values)
+    # sum over [start, end) of each component from cumulative sums
+    sums = np.zeros((values.shape[0], n_frames + 1))
+    np.cumsum(np.where(valid, values, 0), axis=1, out=sums[:, 1:])
+    counts = np.zeros(sums.shape)
+    np.cumsum(valid, axis=1, out=counts[:, 1:])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (sums[:, ends] - sums[:, starts]) / (counts[:, ends] - counts[:, starts])
+
+
+def uniform_schedule(n_frames, bin_size, fps=30):
+    """
+    Schedule of equal bins of `bin_size` sec covering `n_frames` (named '01', '02', ...).
+
+    Returns
+    -------
+    components : pandas DataFrame with the columns of header['components'] (see `fc_dat.scan_header`).
+    """
+    n_bin_frames = int(round(bin_size * fps))
+    start_frame = np.arange(0, n_frames, n_bin_frames)
+    components = pd.DataFrame({'Component': [f'{i + 1:02d}' for i in range(len(start_frame))],
+                               'start': start_frame / fps,
+                               'duration': n_bin_frames / fps,
+                               'start_frame': start_frame,
+                               'duration_frames': n_bin_frames})
+    components['end'] = components['start'] + components['duration']
+
+    return components
+
+
+###################################################################################################
+
+def score_motion(motion, components, threshold, min_duration, animals=None):
+    """
+    Score freezing from motion traces and bin it to a component schedule.
+
+    Parameters
+    ----------
+    motion : array of shape (n_animals, n_frames).
+    components : component schedule (see `bin_frames`).
+    threshold : motion threshold (see `freeze_frames`).
+    min_duration : minimum freeze duration in frames.
+    animals : animal ids for each row of `motion` (default: '0', '1', ...).
+
+    Returns
+    -------
+    df : pandas DataFrame with 'Animal', 'Component', 'PctFreeze' and 'AvgMotion' for each
+        animal and component (same columns as `fc_dat.format_vf_data`, without 'Group').
+    """
+    motion = np.atleast_2d(motion)
+    animals = [str(animal) for animal in (animals if animals is not None else range(len(motion)))]
+    with fc_profile.stage('fc_score.freeze_frames', rows_in=motion.shape[1]):
+        frozen = np.where(np.isnan(motion), np.nan, freeze_frames(motion, threshold, min_duration))
+    with fc_profile.stage('fc_score.bin_frames', rows_in=motion.shape[1]) as st:
+        pct_freeze = bin_frames(frozen, components) * 100
+        avg_motion = bin_frames(motion, components)
+        st.rows_out = pct_freeze.size
+    n_comps = len(components)
+
+    return pd.DataFrame({'Animal': np.repeat(np.array(animals, dtype=object), n_comps),
+                         'Component': np.tile(components['Component'].astype(str).to_numpy(dtype=object),
+                                              len(animals)),
+                         'PctFreeze': pct_freeze.ravel(),
+                         'AvgMotion': avg_motion.ravel()})
+
+
+def score_session(config_path, session, motion_file=None, threshold=None, min_duration=None,
+                  components=None):
+    """
+    Score freezing for a session from its motion traces, in the format of `clean_data`.
+
+    Parameters
+    ----------
+    config_path : path to the project yaml file.
+    session : the session to score.
+    motion_file : (optional) motion trace .csv, or the .json of a `fc_motion` store
+        (default: `<session>_motion_file` in the config).
+    threshold : motion threshold (default: 'Motion Threshold' in the VideoFreeze file header).
+    min_duration : minimum freeze duration in frames (default: 'Min Freeze Duration' in the header).
+    components : (optional) schedule to bin to, e.g. from `uniform_schedule` (default: the
+        'Component Details' in the header).
+
+    Returns
+    -------
+    df : pandas DataFrame with the columns returned by `clean_data`.
+    """
+    expt_info = load_expt_config(config_path)
+    file = session_file(expt_info, session)
+    if motion_file is None:
+        key = f'{session.lower()}_motion_file'
+        if key not in expt_info:
+            raise ValueError(f'`{key}` not found in expt_config.yaml')
+        data_path = expt_info['raw_data_path'] if expt_info['raw_data'] else expt_info['proc_data_path']
+        motion_file = join(data_path, expt_info[key])
+    if threshold is None or min_duration is None or components is None:
+        header = read_header(file)
+        threshold = header['motion_threshold'] if threshold is None else threshold
+        min_duration = header['min_freeze_duration'] if min_duration is None else min_duration
+        components = header['components'] if components is None else components
+    if threshold is None or min_duration is None:
+        raise ValueError('scoring parameters not found in the VideoFreeze file - pass `threshold` and `min_duration`')
+    with fc_profile.stage('fc_score.read_motion'):
+        if motion_file.endswith('.json'):
+            from .fc_motion import MotionStore
+            store = MotionStore(motion_file)
+            motion, animals = store.motion, store.animals
+        else:
+            motion, animals = read_motion_csv(motion_file)
+    df = score_motion(motion, components, threshold, min_duration, animals)
+    df = add_metadata(df, animal_metadata(expt_info))
+    df = label_phases(df, session, expt_info.get('phase_rules'))
+
+    return df.reindex(columns=clean_columns(expt_info))
+
+
+###################################################################################################
+
+# motion array shared with sweep workers (set by `_attach_motion`)
+_shared = {}
+
+
+def _attach_motion(name, shape, dtype):
+    """Worker initializer: view the motion array in shared memory without copying it."""
+    shm = shared_memory.SharedMemory(name=name)
+    _shared['shm'] = shm
+    _shared['motion'] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _sweep_threshold(threshold, min_durations, components, motion=None):
+    """PctFreeze (n_min_durations, n_animals, n_components) for one threshold."""
+    motion = _shared['motion'] if motion is None else motion
+    runs = _still_runs(motion, threshold)
+    missing = np.isnan(motion)
+    return np.stack([bin_frames(np.where(missing, np.nan, _keep_runs(runs, min_duration)), components) * 100
+                     for min_duration in min_durations])
+
+
+def sweep_scoring(motion, components, thresholds, min_durations, animals=None, reference=None, n_jobs=None):
+    """
+    Score freezing over a grid of motion thresholds and minimum freeze durations.
+
+    The motion array is copied once into shared memory and each worker process views it
+    in place, so it is not pickled for every task. Runs below each threshold are found
+    once and reused for every minimum duration.
+
+    Parameters
+    ----------
+    motion : array of shape (n_animals, n_frames).
+    components : component schedule (see `bin_frames`).
+    thresholds : list of motion thresholds.
+    min_durations : list of minimum freeze durations (frames).
+    animals : animal ids for each row of `motion` (default: '0', '1', ...).
+    reference : (optional) pandas DataFrame with 'Animal', 'Component' and 'PctFreeze' to
+        compare to (e.g., `clean_data` output or hand-scored data; may cover a subset of
+        animals/components). Components are matched ignoring case.
+    n_jobs : number of worker processes (default: os.cpu_count()). Use 1 to run in-process.
+
+    Returns
+    -------
+    scores : pandas DataFrame indexed by ('threshold', 'min_duration', 'Animal', 'Component')
+        with 'PctFreeze' (and 'ref_PctFreeze' if `reference` is given).
+    metrics : pandas DataFrame indexed by ('threshold', 'min_duration') with the number of
+        reference bins 'n', Pearson 'r', mean absolute error 'mae' and mean difference 'bias'
+        (scored - reference). None if `reference` is not given.
+    """
+    motion = np.ascontiguousarray(np.atleast_2d(motion), dtype='float32')
+    animals = [str(animal) for animal in (animals if animals is not None else range(len(motion)))]
+    thresholds, min_durations = list(thresholds), list(min_durations)
+    if n_jobs == 1:
+        pct = [_sweep_threshold(threshold, min_durations, components, motion) for threshold in thresholds]
+    else:
+        shm = shared_memory.SharedMemory(create=True, size=motion.nbytes)
+        try:
+            np.ndarray(motion.shape, dtype=motion.dtype, buffer=shm.buf)[:] = motion
+            with ProcessPoolExecutor(max_workers=n_jobs or os.cpu_count(), initializer=_attach_motion,
+                                     initargs=(shm.name, motion.shape, motion.dtype)) as pool:
+                pct = list(pool.map(_sweep_threshold, thresholds, [min_durations] * len(thresholds),
+                                    [components] * len(thresholds)))
+        finally:
+            shm.close()
+            shm.unlink()
+    index = pd.MultiIndex.from_product([thresholds, min_durations, animals,
+                                        components['Component'].astype(str)],
+                                       names=['threshold', 'min_duration', 'Animal', 'Component'])
+    scores = pd.DataFrame({'PctFreeze': np.stack(pct).ravel()}, index=index)
+    if reference is None:
+        return scores, None
+
+    ref = (reference
+           .assign(Animal=reference['Animal'].astype(str),
+                   Component=reference['Component'].astype(str).str.lower())
+           .groupby(['Animal', 'Component'])['PctFreeze'].mean())
+    keys = pd.MultiIndex.from_arrays([index.get_level_values('Animal'),
+                                      index.get_level_values('Component').str.lower()])
+    scores['ref_PctFreeze'] = ref.reindex(keys).to_numpy()
+    diff = scores['PctFreeze'] - scores['ref_PctFreeze']
+    matched = scores.assign(diff=diff, abs_diff=diff.abs()).dropna(subset=['ref_PctFreeze', 'PctFreeze'])
+    grouped = matched.groupby(level=['threshold', 'min_duration'])
+    metrics = pd.DataFrame({'n': grouped.size(),
+                            'r': grouped.apply(lambda grp: grp['PctFreeze'].corr(grp['ref_PctFreeze'])),
+                            'mae': grouped['abs_diff'].mean(),
+                            'bias': grouped['diff'].mean()})
+
+    return scores, metrics
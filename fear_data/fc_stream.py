@@ -0,0 +1,151 @@
+"""
+Process a session one animal at a time, for exports too large to load at once.
+
+The VideoFreeze data table is read in chunks of rows. Rows are buffered until every
+row for an animal has been read, then that animal is cleaned, labeled and windowed
+into trials with the same functions as the in-memory path, so peak memory is set by
+the chunk size and one animal's data rather than the whole session:
+
+    for df in iter_session(config_path, 'train', stage='trials'):
+        ...
+    write_session(config_path, 'train', 'train_trials.csv', stage='trials')
+
+`pd.concat(iter_session(...), ignore_index=True)` is equal to the output of `clean_data`,
+`label_fc_data` or `tfc_trials_df` for the same session.
+"""
+import numpy as np
+import pandas as pd
+from . import fc_profile
+from .fc_dat import (load_expt_config, session_file, scan_header, format_vf_data, animal_metadata,
+                     add_metadata, label_phases, clean_columns, tfc_comp_times, session_times,
+                     label_epochs, window_trials)
+
+STAGES = ['clean', 'label', 'trials']
+# read every column as str so chunk dtypes don't depend on which rows they contain
+STR_COLS = {'Animal': str, 'Group': str, 'Component Name': str}
+
+
+###################################################################################################
+###################################################################################################
+
+def iter_animals(file, chunksize=100000):
+    """
+    Read a VideoFreeze .csv in chunks and yield the formatted data of one animal at a time.
+
+    Rows for each animal must be contiguous in the file, as VideoFreeze writes them.
+
+    Parameters
+    ----------
+    file : path to the .csv to be loaded.
+    chunksize : number of rows read from the data table at a time.
+
+    Yields
+    ------
+    df : pandas DataFrame (see `fc_dat.format_vf_data`) of one animal's rows.
+    """
+    with open(file, 'rt') as f:
+        scan_header(f)
+        pending = None
+        for chunk in pd.read_csv(f, engine='c', chunksize=chunksize, dtype=STR_COLS):
+            with fc_profile.stage('fc_stream.chunk_format', rows_in=len(chunk)) as st:
+                chunk = format_vf_data(chunk)
+                if pending is not None:
+                    chunk = pd.concat([pending, chunk], ignore_index=True)
+                st.rows_out = len(chunk)
+            if not len(chunk):
+                continue
+            animals = chunk['Animal'].to_numpy()
+            starts = np.append(0, np.flatnonzero(animals[1:] != animals[:-1]) + 1)
+            # the last animal may continue in the next chunk
+            for start, end in zip(starts[:-1], starts[1:]):
+                yield chunk.iloc[start:end].reset_index(drop=True)
+            pending = chunk.iloc[starts[-1]:]
+        if pending is not None and len(pending):
+            yield pending.reset_index(drop=True)
+
+
+def iter_session(config_path, session, stage='clean', chunksize=100000, comp_labs_file=None,
+                 win_start=-20, win_end=60):
+    """
+    Process a session one animal at a time.
+
+    Parameters
+    ----------
+    config_path : path to the project yaml file.
+    session : the session to process.
+    stage : 'clean' (`clean_data`), 'label' (`label_fc_data`) or 'trials' (`tfc_trials_df`).
+    chunksize : number of rows read from the data table at a time.
+    comp_labs_file : (optional) .xlsx file of phase times (see `label_fc_data`).
+    win_start : start of window for each trial (stage='trials' only).
+    win_end : end of window for each trial (stage='trials' only).
+
+    Yields
+    ------
+    df : pandas DataFrame of one animal's processed data.
+
+    Notes
+    -----
+    Animals missing from the config or the data are printed once the whole file has been read.
+    `cache_path` is not used since the session is never held in memory.
+    """
+    if stage not in STAGES:
+        raise ValueError(f'stage must be one of {STAGES}')
+    expt_info = load_expt_config(config_path)
+    file = session_file(expt_info, session)
+    meta = animal_metadata(expt_info)
+    if stage != 'clean':
+        if comp_labs_file is None:
+            comp_labs_file = expt_info.get('comp_labs_file')
+        with open(file, 'rt') as f:
+            components = scan_header(f)['components']
+        comp_labs = tfc_comp_times(None, session, header={'components': components},
+                                   comp_labs_file=comp_labs_file)
+        if comp_labs_file is not None:
+            components = None
+    seen = []
+    for df in iter_animals(file, chunksize):
+        seen.append(df['Animal'].iat[0])
+        df = add_metadata(df, meta, verbose=False)
+        with fc_profile.stage(f'fc_stream.{stage}', rows_in=len(df)) as st:
+            if stage == 'clean':
+                df = (label_phases(df, session, expt_info.get('phase_rules'))
+                      .reindex(columns=clean_columns(expt_info)))
+            else:
+                df['Component'] = session_times(df, comp_labs, components)
+                df['epoch'] = label_epochs(df['Component'], comp_labs)
+                if stage == 'trials':
+                    df = window_trials(df, comp_labs, win_start, win_end)
+            st.rows_out = len(df)
+        yield df
+    not_in_cfg = [animal for animal in pd.unique(np.array(seen, dtype=object)) if animal not in meta.index]
+    not_in_data = list(meta.index[~meta.index.isin(seen)])
+    if not_in_cfg:
+        print(f'Animals not found in config: {not_in_cfg}')
+    if not_in_data:
+        print(f'Animals in config not found in data: {not_in_data}')
+
+
+def write_session(config_path, session, out_file, stage='clean', chunksize=100000, **kwargs):
+    """
+    Process a session one animal at a time (see `iter_session`) and append each animal to a .csv.
+
+    Parameters
+    ----------
+    config_path : path to the project yaml file.
+    session : the session to process.
+    out_file : path of the .csv to write (overwritten if it exists).
+    stage : 'clean', 'label' or 'trials'.
+    chunksize : number of rows read from the data table at a time.
+    **kwargs : passed to `iter_session` (comp_labs_file, win_start, win_end).
+
+    Returns
+    -------
+    n_rows : number of rows written.
+    """
+    n_rows = 0
+    with open(out_file, 'w', newline='') as f:
+        for i, df in enumerate(iter_session(config_path, session, stage, chunksize, **kwargs)):
+            df.to_csv(f, index=False, header=(i == 0))
+            n_rows += len(df)
+
+    return n_rows
@@ -0,0 +1,226 @@
+"""
+Generate synthetic VideoFreeze exports for testing and benchmarking.
+"""
+import os
+import csv
+from os.path import join
+import yaml
+import numpy as np
+import pandas as pd
+
+DATA_COLS = ['Experiment', 'Trial', 'Box', 'Animal', 'Group', 'Component Name', 'Freeze Cnt',
+             'Time Freezing', 'Pct Total Time Freezing', 'Pct Component Time Freezing',
+             'Avg Motion Index', 'Min Motion Index', 'Max Motion Index']
+# default protocol (sec) for each session
+PROTOCOLS = {'train': dict(baseline=240, tone=20, trace=20, shock=2, iti=240, n_trials=3, bin_size=20),
+             'tone': dict(baseline=240, tone=20, trace=20, shock=0, iti=240, n_trials=6, bin_size=20),
+             'context': dict(baseline=600, tone=0, trace=0, shock=0, iti=0, n_trials=0, bin_size=60)}
+
+
+###################################################################################################
+###################################################################################################
+
+def _fmt_time(secs):
+    """Format seconds as a VideoFreeze 'Start Time' (e.g. ' 0:04:20.000')."""
+    hrs, rem = divmod(secs, 3600)
+    mins, secs = divmod(rem, 60)
+    return f' {int(hrs)}:{int(mins):02d}:{secs:06.3f}'
+
+
+def make_schedule(baseline=240, tone=20, trace=20, shock=2, iti=240, n_trials=3, bin_size=20, fps=30):
+    """
+    Build a 'Component Details' table for a trace fear conditioning protocol.
+
+    Parameters
+    ----------
+    baseline, tone, trace, shock, iti : duration (sec) of each phase. No components are
+        recorded during the shock, which leaves a gap after each trace.
+    n_trials : number of tone-trace(-shock)-iti trials.
+    bin_size : duration (sec) of each component.
+    fps : video frame rate.
+
+    Returns
+    -------
+    components : pandas DataFrame with 'Component', 'start', 'duration', 'start_frame',
+        'duration_frames' and 'end' columns (as returned by `fc_dat.scan_header`).
+    """
+    names, starts = [], []
+    t, bin_no = 0.0, 1
+
+    def add_bins(duration, label=None):
+        nonlocal t, bin_no
+        for _ in range(int(round(duration / bin_size))):
+            if label is None:
+                names.append(f'{bin_no:02d}')
+                bin_no += 1
+            else:
+                names.append(label)
+            starts.append(t)
+            t = round(t + bin_size, 6)
+
+    add_bins(baseline)
+    for trial in range(1, n_trials + 1):
+        add_bins(tone, f'Tone-{trial}')
+        add_bins(trace, f'Trace-{trial}')
+        t = round(t + shock, 6)
+        add_bins(iti)
+    starts = np.array(starts)
+    components = pd.DataFrame({'Component': names,
+                               'start': starts,
+                               'duration': float(bin_size),
+                               'start_frame': np.round(starts * fps).astype('int64'),
+                               'duration_frames': int(round(bin_size * fps))})
+    components['end'] = components['start'] + components['duration']
+
+    return components
+
+
+def make_vf_export(file, components, n_animals=8, animals=None, quoted=True, n_trailing_blank=4,
+                   expt_name='TFC session', fps=30, seed=0):
+    """
+    Write a synthetic VideoFreeze .csv export.
+
+    Parameters
+    ----------
+    file : path of the .csv to write.
+    components : 'Component Details' table from `make_schedule`.
+    n_animals : number of animals (ignored if `animals` is given).
+    animals : list of animal ids.
+    quoted : if True, quote text fields in the data table as VideoFreeze does.
+    n_trailing_blank : number of empty rows written after the data table.
+    expt_name : value of the 'Experiment' column.
+    fps : video frame rate.
+    seed : random seed.
+
+    Returns
+    -------
+    file : path of the written .csv.
+    """
+    rng = np.random.default_rng(seed)
+    animals = [str(a) for a in animals] if animals is not None else [str(100 + a) for a in range(n_animals)]
+    n_comps = len(components)
+    n_cols = len(DATA_COLS)
+    # freezing increases after each tone so the data have some structure
+    pct_freeze = np.clip(rng.normal(20, 15, (len(animals), n_comps))
+                         + 10 * components['Component'].str.startswith('Tone').cumsum().to_numpy(), 0, 100)
+    avg_motion = np.round(rng.gamma(2, 50, (len(animals), n_comps)) * (1 - pct_freeze / 150), 2)
+    time_freezing = pct_freeze / 100 * components['duration'].to_numpy()
+    session_len = components['end'].max()
+    data = pd.DataFrame({'Experiment': expt_name,
+                         'Trial': '1',
+                         'Box': np.repeat([f'Chamber{i % 8 + 1}' for i in range(len(animals))], n_comps),
+                         'Animal': np.repeat(animals, n_comps),
+                         'Group': 'squad-1',
+                         'Component Name': np.tile(components['Component'].to_numpy(), len(animals)),
+                         'Freeze Cnt': rng.integers(0, 10, len(animals) * n_comps),
+                         'Time Freezing': np.round(time_freezing.ravel(), 3),
+                         'Pct Total Time Freezing': np.round(time_freezing.ravel() / session_len * 100, 2),
+                         'Pct Component Time Freezing': np.round(pct_freeze.ravel(), 2),
+                         'Avg Motion Index': avg_motion.ravel(),
+                         'Min Motion Index': 0,
+                         'Max Motion Index': rng.integers(50, 5000, len(animals) * n_comps)})
+    blank = ',' * (n_cols - 1)
+    with open(file, 'w', newline='') as f:
+        writer = csv.writer(f, quoting=csv.QUOTE_NONNUMERIC if quoted else csv.QUOTE_MINIMAL)
+        writer.writerow(['Date :', pd.Timestamp('2020-02-06 13:25:32').strftime('%m/%d/%y %H:%M:%S')])
+        writer.writerow(['Motion Threshold (au):', 20])
+        writer.writerow(['Detection Method:', 'Linear'])
+        writer.writerow(['Min Freeze Duration (f):', fps])
+        f.write((blank + '\n') * 3)
+        writer.writerow(['Component Details'])
+        writer.writerow(['Component Name', 'Start Time', 'Duration (s)', 'Start Frame', 'Duration Frames'])
+        for comp in components.itertuples(index=False):
+            writer.writerow([comp.Component, _fmt_time(comp.start), comp.duration,
+                             comp.start_frame, comp.duration_frames])
+        f.write(blank + '\n')
+        data.to_csv(f, index=False, quoting=csv.QUOTE_NONNUMERIC if quoted else csv.QUOTE_MINIMAL)
+        f.write((blank + '\n') * n_trailing_blank)
+
+    return file
+
+
+def make_motion(n_animals=8, n_frames=36000, freeze_bout=60, active_bout=90, seed=0):
+    """
+    Simulate per-frame motion index traces that alternate between freezing and moving bouts.
+
+    Parameters
+    ----------
+    n_animals : number of animals.
+    n_frames : number of video frames.
+    freeze_bout, active_bout : mean length (frames) of freezing and moving bouts.
+    seed : random seed.
+
+    Returns
+    -------
+    motion : float32 ndarray of shape (n_animals, n_frames). Motion is mostly below 20
+        (the default VideoFreeze threshold) during freezing bouts.
+    """
+    rng = np.random.default_rng(seed)
+    # two-state chain: frozen animals start moving with p=1/freeze_bout per frame, and vice versa
+    u = rng.random((n_animals, n_frames))
+    state = np.zeros((n_animals, n_frames), dtype=bool)
+    state[:, 0] = u[:, 0] < freeze_bout / (freeze_bout + active_bout)
+    switch_on = u < 1 / active_bout
+    switch_off = u < 1 / freeze_bout
+    for i in range(1, n_frames):
+        state[:, i] = np.where(state[:, i - 1], ~switch_off[:, i], switch_on[:, i])
+    motion = np.where(state, rng.gamma(2, 3, state.shape), rng.gamma(3, 60, state.shape))
+
+    return motion.astype('float32')
+
+
+def make_vf_experiment(out_dir, n_animals=8, sessions=('train', 'tone', 'context'), bin_size=None,
+                       n_trials=None, quoted=True, fps=30, seed=0, motion=False):
+    """
+    Write synthetic exports for each session and a matching expt_config.yaml.
+
+    Parameters
+    ----------
+    out_dir : directory to write files to.
+    n_animals : number of animals (split evenly between two groups and both sexes).
+    sessions : sessions to generate (keys of `PROTOCOLS`).
+    bin_size : component duration (sec) for train/tone sessions (default from `PROTOCOLS`).
+    n_trials : number of trials for train/tone sessions (default from `PROTOCOLS`).
+    quoted : if True, quote text fields in the data table.
+    fps : video frame rate.
+    seed : random seed.
+    motion : if True, also write per-frame motion traces for each session (see `make_motion`)
+        and list them under `<session>_motion_file`.
+
+    Returns
+    -------
+    config_path : path to the written expt_config.yaml.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    animals = [str(100 + a) for a in range(n_animals)]
+    expt_info = {'Experiment': 'synthetic',
+                 'project_path': out_dir,
+                 'fig_path': out_dir,
+                 'raw_data': True,
+                 'raw_data_path': out_dir,
+                 'proc_data_path': out_dir,
+                 'sessions': list(sessions),
+                 'group_ids': {'Group A': animals[0::2], 'Group B': animals[1::2]},
+                 'sex': True,
+                 'sex_ids': {'M': animals[:n_animals // 2], 'F': animals[n_animals // 2:]}}
+    for i, session in enumerate(sessions):
+        protocol = dict(PROTOCOLS[session])
+        if session != 'context':
+            protocol['bin_size'] = bin_size or protocol['bin_size']
+            protocol['n_trials'] = n_trials or protocol['n_trials']
+        components = make_schedule(fps=fps, **protocol)
+        file_name = f'synthetic_{session}_raw.csv'
+        make_vf_export(join(out_dir, file_name), components, animals=animals, quoted=quoted,
+                       expt_name=f'synthetic {session} session', fps=fps, seed=seed + i)
+        expt_info[f'{session}_file'] = file_name
+        if motion:
+            from .fc_score import write_motion_csv
+            n_frames = int(round(components['end'].max() * fps))
+            motion_name = f'synthetic_{session}_motion.csv'
+            write_motion_csv(join(out_dir, motion_name), make_motion(n_animals, n_frames, seed=seed + i), animals)
+            expt_info[f'{session}_motion_file'] = motion_name
+    config_path = join(out_dir, 'expt_config.yaml')
+    with open(config_path, 'w') as f:
+        yaml.safe_dump(expt_info, f, sort_keys=False)
+
+    return config_path
@@ -1,15 +1,19 @@
 import os
+import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 from .plot_utils import savefig, style_plot, check_ax
-from .fc_dat import total_df 
+from .fc_dat import total_df, summary_stats
+
+# error bars drawn from `summary_stats` when `stats` is set
+STATS_ERR = {'sem': ('sem', 0), 'ci': ('ci', 1000)}
 
 ###################################################################################################
 ###################################################################################################
 
 @savefig
 @style_plot
-def plot_fc_bins(df, session, xvar='Component', yvar='PctFreeze', ax=None, fig_size=(16,10), **kwargs):
+def plot_fc_bins(df, session, xvar='Component', yvar='PctFreeze', ax=None, fig_size=(16,10), stats=None, **kwargs):
     
     """ Pointplot of specified `session`.
     
@@ -17,6 +21,8 @@ def plot_fc_bins(df, session, xvar='Component', yvar='PctFreeze', ax=None, fig_s
     ----------
     df : pandas DataFrame from load_data.clean_dat()
     session : name of session
+    stats : None (default) to use seaborn's bootstrapped 68% CI, or 'sem'/'ci' to draw
+        mean +/- SEM or a vectorized bootstrap 68% CI from `summary_stats` (much faster).
     
     Notes
     -----
@@ -39,23 +45,27 @@ def plot_fc_bins(df, session, xvar='Component', yvar='PctFreeze', ax=None, fig_s
         traces = [i-0.5 for i in range(len(bins_list)) if 'trace-' in bins_list[i].lower()]
         [ ax.axvspan(tr+1, tr+1.15, facecolor='#ffb200') for tr in traces ]
 
-    sns.pointplot(x=xvar,
-                  y=yvar,
-                  data=df,
-                  ci=68,
-                  ax=ax,
-                  scale=2.25,
-                  errwidth=6,
-                  capsize=0.05,
-                  **kwargs)
+    if stats is not None:
+        _plot_stats(ax, df, xvar, yvar, stats, kind='point', markersize=14,
+                    elinewidth=6, capsize=4, **kwargs)
+    else:
+        sns.pointplot(x=xvar,
+                      y=yvar,
+                      data=df,
+                      ci=68,
+                      ax=ax,
+                      scale=2.25,
+                      errwidth=6,
+                      capsize=0.05,
+                      **kwargs)
     
-    if session.lower() == 'context':
+    if session.lower() == 'context' and stats is None:
         plt.setp(ax.collections, sizes=[1000])
 
     ax.set_ylabel('Freezing (%)')
     ax.set_xlabel('Time (mins)')
     # replace with x-labels with mins if using Component
-    if session is not 'context':
+    if session.lower() != 'context':
         min_bins = [i for i in range(len(df['Component'].unique())) if (i+1) % 3 == 0]
         min_labs = [ i+1 for i in range(len(min_bins)) ]
         ax.set_xticks(min_bins)
@@ -64,14 +74,14 @@ def plot_fc_bins(df, session, xvar='Component', yvar='PctFreeze', ax=None, fig_s
     if 'hue' in kwargs.keys():
         l = ax.legend()
         l.set_title(None)
-    sns.despine()
+    sns.despine(ax=ax)
  
  
  ###################################################################################################   
     
 @savefig
 @style_plot    
-def plot_fc_phase(df, xvar='Phase', yvar='PctFreeze', kind='bar', pts=True, ax=None, fig_size=(16,9), **kwargs):
+def plot_fc_phase(df, xvar='Phase', yvar='PctFreeze', kind='bar', pts=True, ax=None, fig_size=(16,9), stats=None, **kwargs):
     
     """ Pointplot or barplot (specified by kind).
     
@@ -81,6 +91,8 @@ def plot_fc_phase(df, xvar='Phase', yvar='PctFreeze', kind='bar', pts=True, ax=N
     xvar : x-axis variable (default: 'Phase')
     yvar : y-axis variable (default: 'PctFreeze')
     kind : type of seaborn plot to use (must be 'point' or 'bar')
+    stats : None (default) to use seaborn's bootstrapped 68% CI, or 'sem'/'ci' to draw
+        mean +/- SEM or a vectorized bootstrap 68% CI from `summary_stats` (much faster).
     
     
     Notes
@@ -92,10 +104,6 @@ def plot_fc_phase(df, xvar='Phase', yvar='PctFreeze', kind='bar', pts=True, ax=N
         - Specify fig_path (default is to user Desktop)
     
     """
-    if 'hue' in kwargs.keys():
-        df = df.groupby(['Animal', kwargs.get('hue'), 'Phase'], as_index=False).mean()
-    else:
-        df = df.groupby(['Animal', 'Phase'], as_index=False).mean()
     df = total_df(df, hue=kwargs.get('hue') if 'hue' in kwargs.keys() else None)
     # create figure
     ax = check_ax(ax, figsize=fig_size)
@@ -108,21 +116,26 @@ def plot_fc_phase(df, xvar='Phase', yvar='PctFreeze', kind='bar', pts=True, ax=N
         kwargs['linewidth'] = 4
         
     if 'tone' not in df.Phase.unique():
-        plt.tick_params(labelbottom=False) 
+        ax.tick_params(labelbottom=False) 
     # Determine the plotting function
     # use `kind` to specify type of phase plot
-    plot_func = getattr(sns, kind+'plot')
-    
-    plot_func(x=xvar,
-              y=yvar,
-              data=df,
-              ci=68,
-              ax=ax,
-              errwidth=8,
-              capsize=0.05,
-              **kwargs)
+    if stats is not None:
+        _plot_stats(ax, df, xvar, yvar, stats, kind=kind, elinewidth=8, capsize=8,
+                    markersize=28, **kwargs)
+    else:
+        plot_func = getattr(sns, kind+'plot')
+        
+        plot_func(x=xvar,
+                  y=yvar,
+                  data=df,
+                  ci=68,
+                  ax=ax,
+                  errwidth=8,
+                  capsize=0.05,
+                  **kwargs)
     
-    plt.setp(ax.collections, sizes=[1000])
+    if stats is None:
+        plt.setp(ax.collections, sizes=[1000])
     
     if pts == True:
         sns.swarmplot(x=xvar, y=yvar, data=df,
@@ -130,12 +143,12 @@ def plot_fc_phase(df, xvar='Phase', yvar='PctFreeze', kind='bar', pts=True, ax=N
         handles, labels = ax.get_legend_handles_labels()
         nhandles = len(handles)
         first_handle = int(nhandles/2)
-        plt.legend(handles[first_handle:nhandles], labels[first_handle:nhandles])
+        ax.legend(handles[first_handle:nhandles], labels[first_handle:nhandles])
 
     ax.set_ylabel('Freezing (%)')
     ax.set_xlabel('')
     # replace with x-labels with mins if using Component
-    if xvar is 'Component':
+    if xvar == 'Component':
         min_bins = [i for i in range(len(df['Component'].unique())) if (i+1) % 3 == 0]
         min_labs = [ i+1 for i in range(len(min_bins)) ]
         ax.set_xticks(min_bins)
@@ -144,4 +157,44 @@ def plot_fc_phase(df, xvar='Phase', yvar='PctFreeze', kind='bar', pts=True, ax=N
     if 'hue' in kwargs.keys():
         l = ax.legend()
         l.set_title(None)
-    sns.despine()
\ No newline at end of file
+    sns.despine(ax=ax)
+
+
+###################################################################################################
+
+def _plot_stats(ax, df, xvar, yvar, stats, kind='point', hue=None, palette=None, dodge=0.8,
+                markersize=14, elinewidth=6, capsize=4, edgecolor=None, linewidth=None, scale=None, **kwargs):
+    """ Draw means and error bars from `summary_stats` with matplotlib.
+    
+    Uses the same x positions (0, 1, ...) and level order as the seaborn plots. Extra
+    seaborn-only keyword arguments are ignored.
+    """
+    if stats not in STATS_ERR:
+        raise ValueError(f'`stats` must be one of {list(STATS_ERR)}')
+    err, n_boot = STATS_ERR[stats]
+    table = summary_stats(df, xvar, yvar, hue=hue, n_boot=n_boot)
+    x_levels = list(dict.fromkeys(table[xvar]))
+    x_pos = {val: i for i, val in enumerate(x_levels)}
+    hue_levels = list(dict.fromkeys(table[hue])) if hue is not None else [None]
+    colors = sns.color_palette(palette, len(hue_levels))
+    width = dodge / len(hue_levels)
+    for i, (level, color) in enumerate(zip(hue_levels, colors)):
+        sub = table if hue is None else table[table[hue] == level]
+        x = sub[xvar].map(x_pos).to_numpy(dtype=float)
+        yerr = (sub['sem'] if err == 'sem'
+                else np.vstack([sub['mean'] - sub['ci_low'], sub['ci_high'] - sub['mean']]))
+        if kind == 'bar':
+            x = x - dodge / 2 + width * (i + 0.5)
+            ax.bar(x, sub['mean'], width=width, color=color, label=level,
+                   edgecolor=edgecolor, linewidth=linewidth)
+            ax.errorbar(x, sub['mean'], yerr=yerr, fmt='none', ecolor='0.26',
+                        elinewidth=elinewidth, capsize=capsize)
+        else:
+            ax.errorbar(x, sub['mean'], yerr=yerr, color=color, marker='o', markersize=markersize,
+                        linewidth=elinewidth / 2, elinewidth=elinewidth, capsize=capsize, label=level)
+    ax.set_xticks(range(len(x_levels)))
+    ax.set_xticklabels(x_levels)
+    ax.set_xlabel(xvar)
+    ax.set_ylabel(yvar)
+
+    return table
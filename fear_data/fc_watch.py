@@ -0,0 +1,199 @@
+"""
+Incremental ingestion of VideoFreeze exports as they are added to the data directory.
+
+A session can be split over several exports by setting a glob pattern with
+`<session>_file_pattern` in the config (e.g. 'train_squad*.csv'); otherwise its single
+`<session>_file` is used. `scan` compares the matching files with a
+manifest of processed files (path, size, mtime and hash) kept in `proc_data_path` and only
+parses new or changed files:
+
+    <session>_clean.csv        cleaned rows (see `clean_data`) with the source 'File'.
+                               Rows from new files are appended; rows from changed or
+                               deleted files are replaced or removed.
+    <session>_phase_means.csv  mean PctFreeze/AvgMotion for each animal and phase, rebuilt
+                               from per-file sums so untouched files are never re-read.
+
+`watch` polls the directory with `scan`, so no OS file-watch service is needed.
+"""
+import os
+import glob
+import json
+import time
+from os.path import join, exists, abspath, basename, getsize, getmtime
+import pandas as pd
+from .fc_dat import (load_expt_config, read_vf_csv, format_vf_data, animal_metadata, add_metadata,
+                     label_phases, clean_columns)
+from .fc_cache import CONFIG_KEYS, file_hash, config_hash
+
+MANIFEST = 'fear_data_ingest.json'
+SUM_COLS = ['n', 'PctFreeze', 'AvgMotion']
+
+
+###################################################################################################
+###################################################################################################
+
+def output_files(expt_info, session):
+    """Paths of the cleaned rows and phase means written for `session`."""
+    proc_path = expt_info['proc_data_path']
+    return join(proc_path, f'{session}_clean.csv'), join(proc_path, f'{session}_phase_means.csv')
+
+
+def session_files(expt_info, session):
+    """Exports matching `<session>_file_pattern` (or the `<session>_file`) in the config (sorted)."""
+    data_path = expt_info['raw_data_path'] if expt_info['raw_data'] else expt_info['proc_data_path']
+    pattern = expt_info.get(f'{session}_file_pattern') or glob.escape(expt_info[f'{session}_file'])
+    outputs = [abspath(path) for path in output_files(expt_info, session)]
+    return sorted(abspath(path) for path in glob.glob(join(data_path, pattern))
+                  if abspath(path) not in outputs)
+
+
+def _clean_file(file, session, expt_info, meta):
+    """Clean one export like `clean_data`, adding the source 'File'."""
+    df, _ = read_vf_csv(file)
+    df = add_metadata(format_vf_data(df), meta, verbose=False)
+    df = label_phases(df, session, expt_info.get('phase_rules'))
+    df = df.reindex(columns=clean_columns(expt_info))
+    df['File'] = file
+
+    return df
+
+
+def _phase_sums(df):
+    """Per animal/phase sums of one file, so means can be updated without re-reading it."""
+    ids = list(df.columns[:df.columns.get_loc('Phase') + 1])
+    sums = (df.groupby(ids, sort=False, dropna=False)
+            .agg(n=('PctFreeze', 'count'), PctFreeze=('PctFreeze', 'sum'), AvgMotion=('AvgMotion', 'sum'))
+            .reset_index())
+    return sums.astype(object).where(sums.notna(), None).to_dict(orient='list')
+
+
+def _phase_means(entries, expt_info):
+    """Phase means of every animal from the per-file sums in the manifest."""
+    cols = clean_columns(expt_info)
+    ids = cols[:cols.index('Phase') + 1]
+    sums = pd.concat([pd.DataFrame(entry['phase_sums']) for entry in entries]
+                     or [pd.DataFrame(columns=ids + SUM_COLS).astype(dict.fromkeys(SUM_COLS, 'float64'))],
+                     ignore_index=True)
+    sums['Animal'] = sums['Animal'].astype(str)
+    means = sums.groupby(ids, sort=False, dropna=False)[SUM_COLS].sum()
+    means[['PctFreeze', 'AvgMotion']] = means[['PctFreeze', 'AvgMotion']].div(means['n'], axis=0)
+
+    return means.reset_index()
+
+
+###################################################################################################
+
+def scan(config_path, sessions=None):
+    """
+    Process new or changed exports for each session and update the outputs in `proc_data_path`.
+
+    A file is reprocessed if its size changed, or its mtime changed and its hash differs.
+    If the config's animal info changed every file is reprocessed.
+
+    Parameters
+    ----------
+    config_path : path to the project yaml file.
+    sessions : sessions to scan (default: all sessions in the config).
+
+    Returns
+    -------
+    report : pandas DataFrame with the 'Session', 'File', 'status' ('new', 'changed',
+        'removed' or 'unchanged') and number of 'rows' of each file.
+    """
+    expt_info = load_expt_config(config_path)
+    os.makedirs(expt_info['proc_data_path'], exist_ok=True)
+    manifest_file = join(expt_info['proc_data_path'], MANIFEST)
+    manifest = {}
+    if exists(manifest_file):
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+    cfg_hash = config_hash(expt_info, keys=CONFIG_KEYS + ['phase_rules'])
+    if manifest.get('config_hash') != cfg_hash:
+        # group info changed: rebuild everything
+        manifest = {'config_hash': cfg_hash, 'sessions': {}}
+        for session in expt_info['sessions']:
+            for out_file in output_files(expt_info, session):
+                if exists(out_file):
+                    os.remove(out_file)
+    meta = animal_metadata(expt_info)
+    report = []
+    for session in (sessions if sessions is not None else expt_info['sessions']):
+        session = session.lower()
+        entries = manifest['sessions'].setdefault(session, {})
+        clean_file, means_file = output_files(expt_info, session)
+        files = session_files(expt_info, session)
+        if not files and not entries:
+            # session not exported yet
+            continue
+        stale, new_rows = [], []
+        for file in files:
+            prev = entries.get(file)
+            size, mtime = getsize(file), getmtime(file)
+            if prev is not None and prev['size'] == size and prev['mtime'] == mtime:
+                report.append((session, file, 'unchanged', prev['rows']))
+                continue
+            digest = file_hash(file)
+            if prev is not None and prev['size'] == size and prev['hash'] == digest:
+                prev['mtime'] = mtime
+                report.append((session, file, 'unchanged', prev['rows']))
+                continue
+            df = _clean_file(file, session, expt_info, meta)
+            if prev is not None:
+                stale.append(file)
+            new_rows.append(df)
+            entries[file] = {'size': size, 'mtime': mtime, 'hash': digest, 'rows': len(df),
+                             'phase_sums': _phase_sums(df)}
+            report.append((session, file, 'new' if prev is None else 'changed', len(df)))
+        removed = [file for file in entries if file not in files]
+        for file in removed:
+            report.append((session, file, 'removed', entries.pop(file)['rows']))
+        if (stale or removed) and exists(clean_file):
+            # drop rows from changed or deleted files before appending
+            drop = set(stale + removed)
+            kept = pd.read_csv(clean_file, dtype={'Animal': str, 'Component': str})
+            kept[~kept['File'].isin(drop)].to_csv(clean_file, index=False)
+        for df in new_rows:
+            df.to_csv(clean_file, mode='a', index=False, header=not exists(clean_file))
+        if new_rows or stale or removed or not exists(means_file):
+            _phase_means(entries.values(), expt_info).to_csv(means_file, index=False)
+    tmp_file = manifest_file + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_file, manifest_file)
+
+    return pd.DataFrame(report, columns=['Session', 'File', 'status', 'rows'])
+
+
+def watch(config_path, interval=60, sessions=None, max_scans=None, verbose=True):
+    """
+    Poll the data directory and run `scan` every `interval` sec (stop with Ctrl-C).
+
+    Parameters
+    ----------
+    config_path : path to the project yaml file.
+    interval : seconds between scans.
+    sessions : sessions to scan (default: all sessions in the config).
+    max_scans : stop after this many scans (default: run until interrupted).
+    verbose : if True, print files that were processed in each scan.
+
+    Returns
+    -------
+    report : pandas DataFrame of files processed over all scans (see `scan`) with the 'scan' number.
+    """
+    reports = []
+    n_scans = 0
+    try:
+        while max_scans is None or n_scans < max_scans:
+            report = scan(config_path, sessions)
+            report = report[report['status'] != 'unchanged'].assign(scan=n_scans)
+            if verbose:
+                for row in report.itertuples():
+                    print(f'{row.Session}: {row.status} {basename(row.File)} ({row.rows} rows)')
+            reports.append(report)
+            n_scans += 1
+            if max_scans is None or n_scans < max_scans:
+                time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+
+    return pd.concat(reports, ignore_index=True) if reports else None
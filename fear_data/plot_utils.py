@@ -145,7 +145,7 @@ def apply_custom_style(ax, style_args=AXIS_STYLE_ARGS, **kwargs):
                   loc=kwargs.pop('legend_loc', LEGEND_LOC),
                   markerscale=kwargs.pop('markerscale', MARKERSCALE))
 
-    plt.tight_layout()
+    ax.figure.tight_layout()
 
 
 ###################################################################################################
@@ -178,13 +178,16 @@ def style_plot(func, *args, **kwargs):
         return dict(zip(reversed(argspec.args), reversed(argspec.defaults)))
 
 
+    # look up default args once, rather than on every call
+    default_kwargs = get_default_args(func)
+
     @wraps(func)
     def decorated(*args, **kwargs):
 
         # Grab a custom style function, if provided, and grab any provided style arguments
         style_func = kwargs.pop('custom_style', apply_custom_style)
         style_args = kwargs.pop('style_args', STYLE_ARGS)
-        kwargs_local = get_default_args(func)
+        kwargs_local = dict(default_kwargs)
         kwargs_local.update(kwargs)
         style_kwargs = {key : kwargs.pop(key) for key in style_args if key in kwargs}
         # Create the plot
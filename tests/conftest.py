@@ -0,0 +1,23 @@
+from pathlib import Path
+import pytest
+import yaml
+
+EXAMPLE_DATA = Path(__file__).parents[1] / 'files' / 'example-data'
+
+
+@pytest.fixture
+def example_config(tmp_path):
+    """Config for the bundled example TFC exports."""
+    cfg = {'Experiment': 'example_experiment',
+           'raw_data': True,
+           'raw_data_path': str(EXAMPLE_DATA),
+           'proc_data_path': str(tmp_path / 'proc'),
+           'sessions': ['train', 'tone', 'context'],
+           'train_file': 'TFC_3trial_train_raw.csv',
+           'tone_file': 'TFC_3trial_tone_raw.csv',
+           'context_file': 'TFC_3trial_context_raw.csv',
+           'group_ids': {'Group A': ['277', '278', '272', '283'], 'Group B': ['257', '258', '273', '284']},
+           'sex': False}
+    config_path = tmp_path / 'expt_config.yaml'
+    config_path.write_text(yaml.safe_dump(cfg))
+    return str(config_path)
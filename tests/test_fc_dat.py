@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+import pytest
+from fear_data.fc_dat import (label_fc_data, tfc_trials_df, tfc_trials_array, window_trials, label_epochs,
+                              resample_bins, resample_trials)
+from fear_data.fc_synth import make_vf_experiment
+
+PHASES = ['baseline', 'tone-01', 'trace-01', 'shock-01', 'iti-01', 'tone-02', 'trace-02', 'shock-02',
+          'iti-02', 'tone-03', 'trace-03', 'shock-03', 'iti-03']
+
+
+###################################################################################################
+# label_fc_data / tfc_trials_df
+
+def test_label_fc_data_uses_header_times(example_config):
+    df = label_fc_data(example_config, 'train')
+    animal = df[df['Animal'] == df['Animal'].iloc[0]]
+    # bins after each shock start 2 s later than an equal spacing would give
+    assert animal['Component'].iloc[10:16].tolist() == [200, 220, 240, 260, 282, 302]
+    assert isinstance(df['epoch'].dtype, pd.CategoricalDtype)
+    assert df['epoch'].cat.categories.tolist() == PHASES
+    assert animal['epoch'].iloc[10:16].tolist() == ['baseline', 'baseline', 'tone-01', 'trace-01',
+                                                     'iti-01', 'iti-01']
+
+
+def test_tfc_trials_df_trial_time(example_config):
+    df = tfc_trials_df(example_config, 'train')
+    assert df['Trial'].unique().tolist() == [1, 2, 3]
+    for _, trial in df.groupby(['Animal', 'Trial']):
+        assert trial['trial_time'].tolist() == [-20, 0, 20, 42]
+
+
+def test_window_trials_ragged_animals():
+    comp_labs = pd.DataFrame({'phase': ['baseline', 'tone-01', 'iti-01'],
+                              'start': [0.0, 10.0, 15.0], 'end': [10.0, 15.0, 30.0]})
+    # second animal has fewer, coarser bins
+    df = pd.DataFrame({'Animal': ['a'] * 7 + ['b'] * 3,
+                       'Component': [0, 5, 10, 15, 20, 25, 30, 0, 10, 20],
+                       'PctFreeze': np.arange(10.0)})
+    out = window_trials(df, comp_labs, win_start=-5, win_end=10)
+    assert out.groupby('Animal')['trial_time'].apply(list).to_dict() == {'a': [-5, 0, 5, 10],
+                                                                         'b': [0, 10]}
+
+
+def test_tfc_trials_array_matches_trials_df(example_config):
+    data, coords = tfc_trials_array(example_config, 'train')
+    assert data.shape == (8, 3, 5)
+    assert coords['trial_time'].tolist() == [-20, 0, 20, 40, 60]
+    assert not np.isnan(data).any()
+    df = tfc_trials_df(example_config, 'train')
+    first = df[df['Animal'] == coords['Animal'][0]]
+    expected = first[first['trial_time'] <= 20].pivot(index='Trial', columns='trial_time', values='PctFreeze')
+    np.testing.assert_allclose(data[0, :, :3], expected.to_numpy())
+
+
+###################################################################################################
+# label_epochs
+
+def test_label_epochs_overlap_and_gaps():
+    comp_labs = pd.DataFrame({'phase': ['baseline', 'tone', 'iti', 'tone'],
+                              'start': [0.0, 10.0, 30.0, 50.0], 'end': [10.0, 20.0, 40.0, 60.0]})
+    times = [0, 5, 10, 15, 20, 25, 30, 40, 45, 55, 70]
+    epoch = label_epochs(times, comp_labs)
+    # boundaries are inclusive and the later interval wins at 10; 25, 45 and 70 are in gaps
+    assert epoch.categories.tolist() == ['baseline', 'tone', 'iti']
+    assert list(epoch.astype(object)) == ['baseline', 'baseline', 'tone', 'tone', 'tone', np.nan,
+                                          'iti', 'iti', np.nan, 'tone', np.nan]
+
+
+###################################################################################################
+# resample_bins
+
+@pytest.fixture
+def ragged():
+    rng = np.random.default_rng(0)
+    lengths = [10, 7, 5]
+    times = np.full((3, 10), np.nan)
+    values = np.full((3, 10), np.nan)
+    for i, n in enumerate(lengths):
+        times[i, :n] = np.sort(rng.uniform(0, 20, n))
+        values[i, :n] = rng.normal(size=n)
+    return times, values, lengths, np.linspace(-1, 21, 40)
+
+
+def test_resample_linear(ragged):
+    times, values, lengths, points = ragged
+    out = resample_bins(times, values, points, method='linear')
+    for i, n in enumerate(lengths):
+        expected = np.interp(points, times[i, :n], values[i, :n], left=np.nan, right=np.nan)
+        np.testing.assert_allclose(out[i], expected)
+
+
+def test_resample_mean(ragged):
+    times, values, lengths, points = ragged
+    out = resample_bins(times, values, points, method='mean', width=2)
+    for i, n in enumerate(lengths):
+        t, v = times[i, :n], values[i, :n]
+        expected = [v[(t >= p - 1) & (t < p + 1)].mean() if ((t >= p - 1) & (t < p + 1)).any() else np.nan
+                    for p in points]
+        np.testing.assert_allclose(out[i], expected)
+
+
+def test_resample_nearest(ragged):
+    times, values, lengths, points = ragged
+    out = resample_bins(times, values, points, method='nearest')
+    for i, n in enumerate(lengths):
+        t, v = times[i, :n], values[i, :n]
+        half_bin = np.median(np.diff(t)) / 2
+        inside = (points >= t[0] - half_bin) & (points <= t[-1] + half_bin)
+        np.testing.assert_array_equal(np.isnan(out[i]), ~inside)
+        nearest = np.abs(points[:, None] - t).argmin(axis=1)
+        np.testing.assert_allclose(out[i][inside], v[nearest][inside])
+
+
+def test_resample_bins_rejects_unknown_method():
+    with pytest.raises(ValueError):
+        resample_bins([[0.0, 1.0]], [[0.0, 1.0]], [0.5], method='cubic')
+
+
+def test_resample_trials_common_grid(tmp_path):
+    grid = np.arange(-20, 61, 2.0)
+    frames = [resample_trials(make_vf_experiment(str(tmp_path / str(bin_size)), n_animals=4, bin_size=bin_size),
+                              'train', grid=grid, method='linear')
+              for bin_size in [0.5, 1.0]]
+    for df in frames:
+        assert df.groupby(['Animal', 'Trial'])['trial_time'].apply(list).map(lambda t: t == grid.tolist()).all()
+    assert frames[0][['Animal', 'Trial', 'trial_time']].equals(frames[1][['Animal', 'Trial', 'trial_time']])
@@ -0,0 +1,13 @@
+import pytest
+from fear_data import fc_db
+
+
+@pytest.mark.parametrize('by', [['Bogus'], 'Phase" FROM bins; --'])
+def test_query_rejects_unknown_by(tmp_path, by):
+    with pytest.raises(ValueError):
+        fc_db.query(str(tmp_path / 'fc.db'), by=by)
+
+
+def test_query_rejects_unknown_filter(tmp_path):
+    with pytest.raises(ValueError):
+        fc_db.query(str(tmp_path / 'fc.db'), colors='red')
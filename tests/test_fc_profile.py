@@ -0,0 +1,15 @@
+import numpy as np
+from fear_data import fc_profile
+
+
+def test_nested_stage_keeps_outer_peak():
+    with fc_profile.profile() as report:
+        with fc_profile.stage('outer'):
+            big = np.ones(5_000_000)
+            del big
+            with fc_profile.stage('inner'):
+                small = np.ones(1000)
+    peaks = report.to_frame().set_index('stage')['peak_mb']
+    assert peaks['outer'] >= 40
+    assert peaks['inner'] < 1
+    del small
@@ -0,0 +1,58 @@
+import yaml
+import pandas as pd
+from fear_data import fc_watch
+from fear_data.fc_synth import make_schedule, make_vf_export
+
+
+def _config(tmp_path, sessions):
+    raw, proc = tmp_path / 'raw', tmp_path / 'proc'
+    raw.mkdir()
+    cfg = {'Experiment': 'watch', 'raw_data': True, 'raw_data_path': str(raw), 'proc_data_path': str(proc),
+           'sessions': sessions, 'group_ids': {'A': ['1', '2'], 'B': ['3', '4']}, 'sex': False}
+    cfg.update({f'{session}_file': f'{session}.csv' for session in sessions})
+    config_path = tmp_path / 'expt_config.yaml'
+    config_path.write_text(yaml.safe_dump(cfg))
+    return str(config_path), raw, proc
+
+
+def test_scan_before_later_sessions_are_exported(tmp_path):
+    config_path, raw, proc = _config(tmp_path, ['train', 'tone'])
+    make_vf_export(str(raw / 'train.csv'), make_schedule(), animals=['1', '2', '3', '4'])
+
+    report = fc_watch.scan(config_path)
+    assert report[['Session', 'status']].values.tolist() == [['train', 'new']]
+    assert (proc / fc_watch.MANIFEST).exists()
+    assert not (proc / 'tone_clean.csv').exists()
+    means = pd.read_csv(proc / 'train_phase_means.csv')
+    assert means['Animal'].nunique() == 4
+
+    # tone export arrives later; train is not reprocessed
+    make_vf_export(str(raw / 'tone.csv'), make_schedule(), animals=['1', '2', '3', '4'])
+    report = fc_watch.scan(config_path).set_index('Session')['status']
+    assert report.to_dict() == {'train': 'unchanged', 'tone': 'new'}
+    assert (proc / 'tone_phase_means.csv').exists()
+
+
+def test_scan_removed_file_without_output(tmp_path):
+    config_path, raw, proc = _config(tmp_path, ['train'])
+    make_vf_export(str(raw / 'train.csv'), make_schedule(), animals=['1', '2'])
+    fc_watch.scan(config_path)
+    (raw / 'train.csv').unlink()
+    (proc / 'train_clean.csv').unlink()
+
+    report = fc_watch.scan(config_path)
+    assert report['status'].tolist() == ['removed']
+
+
+def test_file_pattern(tmp_path):
+    config_path, raw, proc = _config(tmp_path, ['train'])
+    cfg = yaml.safe_load(open(config_path))
+    cfg['train_file_pattern'] = 'train_sq*.csv'
+    open(config_path, 'w').write(yaml.safe_dump(cfg))
+    make_vf_export(str(raw / 'train_sq1.csv'), make_schedule(), animals=['1', '2'], seed=1)
+    make_vf_export(str(raw / 'train_sq2.csv'), make_schedule(), animals=['3', '4'], seed=2)
+
+    report = fc_watch.scan(config_path)
+    assert report['status'].tolist() == ['new', 'new']
+    clean = pd.read_csv(proc / 'train_clean.csv', dtype={'Animal': str})
+    assert sorted(clean['Animal'].unique()) == ['1', '2', '3', '4']